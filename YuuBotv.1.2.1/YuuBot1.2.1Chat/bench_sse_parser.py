@@ -0,0 +1,136 @@
+"""
+Benchmark the incremental SSE parser against the previous line-based parser.
+
+Usage:
+    python bench_sse_parser.py                      # synthetic ~8 MB tool-heavy stream
+    python bench_sse_parser.py --size-mb 32
+    python bench_sse_parser.py recorded.sse ...     # raw SSE bytes saved from agent :run
+
+Each stream is parsed by both implementations. The previous parser reads through
+requests' iter_lines(decode_unicode=True), exactly as stream_events used to; the
+incremental parser gets the stream cut into --chunk-size pieces.
+"""
+
+import argparse
+import io
+import json
+import random
+import time
+
+import requests
+
+from sse_parser import iter_sse_events
+
+
+def legacy_iter_sse_events(resp: requests.Response):
+    # The parser stream_events used before sse_parser.py, kept here for comparison
+    class _SSEEvent:
+        def __init__(self, event, data):
+            self.event = event or "message"
+            self.data = data
+
+    data_lines = []
+    event_name = None
+    for raw in resp.iter_lines(decode_unicode=True):
+        if raw is None:
+            continue
+        line = raw.rstrip("\n")
+        if line == "":
+            if data_lines or event_name is not None:
+                yield _SSEEvent(event_name, "\n".join(data_lines))
+            data_lines = []
+            event_name = None
+            continue
+        if line.startswith(":"):
+            continue
+        if ":" in line:
+            field, value = line.split(":", 1)
+            value = value.lstrip()
+        else:
+            field, value = line, ""
+        if field == "event":
+            event_name = value
+        elif field == "data":
+            data_lines.append(value)
+    if data_lines or event_name is not None:
+        yield _SSEEvent(event_name, "\n".join(data_lines))
+
+
+def synthetic_stream(size_mb: float, seed: int = 7) -> bytes:
+    """Build an agent-like stream: many small text/thinking deltas with large tool results and tables."""
+    rng = random.Random(seed)
+    words = ["magnitude", "epicenter", "Tokyo", "intensity", "depth", "tsunami", "震度", "弱", "強", "km"]
+    out = io.BytesIO()
+    target = int(size_mb * 1024 * 1024)
+    index = 0
+    while out.tell() < target:
+        roll = rng.random()
+        if roll < 0.85:
+            event = "response.text.delta" if roll < 0.6 else "response.thinking.delta"
+            data = {"content_index": index % 4, "text": " ".join(rng.choice(words) for _ in range(rng.randint(1, 6)))}
+        elif roll < 0.97:
+            event = "response.tool_result"
+            rows = [[f"2024-01-{d % 28 + 1:02d}", rng.uniform(1, 7), rng.choice(words)] for d in range(rng.randint(50, 800))]
+            data = {"content_index": index % 4, "tool_use_id": f"t{index}", "content": [{"type": "json", "json": {"rows": rows}}]}
+        else:
+            event = "response.status"
+            data = {"status": "executing_tool", "message": "Running SQL..."}
+        out.write(f"id: {index}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        index += 1
+    return out.getvalue()
+
+
+def chunked(payload: bytes, chunk_size: int):
+    return [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+
+
+def run_legacy(payload: bytes, chunk_size: int) -> int:
+    # iter_lines() always reads in its default 512-byte pieces, which is what stream_events used
+    resp = requests.Response()
+    resp.raw = io.BytesIO(payload)
+    resp.encoding = "utf-8"
+    return sum(1 for _ in legacy_iter_sse_events(resp))
+
+
+def run_incremental(payload: bytes, chunk_size: int) -> int:
+    return sum(1 for _ in iter_sse_events(chunked(payload, chunk_size)))
+
+
+def bench(name: str, payload: bytes, chunk_size: int, repeat: int) -> None:
+    mb = len(payload) / (1024 * 1024)
+    print(f"{name}: {mb:.1f} MB, incremental chunk size {chunk_size} B")
+    results = {}
+    for label, fn in (("line-based (iter_lines)", run_legacy), ("incremental (sse_parser)", run_incremental)):
+        best = None
+        count = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = fn(payload, chunk_size)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[label] = (best, count)
+        print(f"  {label:26s} {best * 1000:9.1f} ms  {count:8d} events  {mb / best:7.1f} MB/s")
+    (legacy_time, legacy_count), (new_time, new_count) = results.values()
+    if legacy_count != new_count:
+        print(f"  WARNING: event counts differ ({legacy_count} vs {new_count})")
+    print(f"  speedup: {legacy_time / new_time:.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="recorded raw SSE streams")
+    parser.add_argument("--size-mb", type=float, default=8.0, help="size of the synthetic stream")
+    parser.add_argument("--chunk-size", type=int, default=8192, help="bytes per simulated socket read")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per parser; the best is reported")
+    args = parser.parse_args()
+
+    if args.files:
+        for path in args.files:
+            with open(path, "rb") as fh:
+                bench(path, fh.read(), args.chunk_size, args.repeat)
+    else:
+        bench("synthetic", synthetic_stream(args.size_mb), args.chunk_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import json
+import os
+
+from models import Message
+
+# Conversation windowing for agent requests. The whole chat history stays in
+# st.session_state for display, but each :run request only carries a bounded
+# window of it: the most recent turns verbatim, older turns reduced to their
+# text (tool calls, tool results, tables and charts are replaced by a one-line
+# note), and, once even that exceeds the budget, the oldest turns dropped and
+# recalled in a short summary folded into the first kept user message.
+#
+# Sizes are estimated from the serialized JSON at ~4 bytes per token, which is
+# close enough to keep the request bounded without running a tokenizer.
+HISTORY_TOKEN_BUDGET = int(os.getenv("YUUBOT_HISTORY_TOKEN_BUDGET", "12000"))
+HISTORY_KEEP_TURNS = int(os.getenv("YUUBOT_HISTORY_KEEP_TURNS", "2"))
+HISTORY_SUMMARY = os.getenv("YUUBOT_HISTORY_SUMMARY", "1") == "1"
+BYTES_PER_TOKEN = 4
+OLDER_TEXT_CHARS = 1500
+SUMMARY_MAX_TURNS = 10
+SUMMARY_SNIPPET_CHARS = 160
+
+
+def estimate_tokens(message: dict) -> int:
+    """Estimate the tokens a serialized message adds to the request."""
+    return len(json.dumps(message, ensure_ascii=False).encode("utf-8")) // BYTES_PER_TOKEN + 1
+
+
+def split_turns(messages: list) -> list:
+    """
+    Group messages into turns, each starting at a user message.
+
+    Parameters:
+    messages (list): Message dicts in chronological order.
+
+    Returns:
+    list: A list of turns, each a list of message dicts.
+    """
+    turns = []
+    for message in messages:
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+def _describe_item(item: dict) -> str | None:
+    kind = item.get("type")
+    if kind == "table":
+        table = item.get("table") or {}
+        rows = len(((table.get("result_set") or {}).get("data")) or [])
+        title = table.get("title")
+        return f"table{f' {title!r}' if title else ''} ({rows} rows)"
+    if kind == "chart":
+        return "chart"
+    if kind == "tool_result":
+        result = item.get("tool_result") or {}
+        return f"{result.get('name') or result.get('type') or 'tool'} result ({result.get('status', 'unknown')})"
+    if kind == "tool_use":
+        return f"{(item.get('tool_use') or {}).get('name', 'tool')} call"
+    return None
+
+
+def compact_message(message: dict) -> dict:
+    """
+    Reduce an older message to its text, noting what was left out.
+
+    Parameters:
+    message (dict): A serialized message.
+
+    Returns:
+    dict: A message with only text content items.
+    """
+    texts = []
+    omitted = []
+    for item in message.get("content") or []:
+        if item.get("type") == "text":
+            texts.append({"type": "text", "text": _truncate(item.get("text", ""), OLDER_TEXT_CHARS)})
+        else:
+            description = _describe_item(item)
+            if description:
+                omitted.append(description)
+    if omitted:
+        texts.append({"type": "text", "text": f"[Earlier output omitted: {', '.join(omitted)}]"})
+    if not texts:
+        texts.append({"type": "text", "text": "[Earlier output omitted]"})
+    return {"role": message.get("role", "assistant"), "content": texts}
+
+
+def _first_text(turn: list, role: str) -> str:
+    for message in turn:
+        if message.get("role") != role:
+            continue
+        for item in message.get("content") or []:
+            if item.get("type") == "text" and item.get("text"):
+                return " ".join(item["text"].split())
+    return ""
+
+
+def summarize_turns(turns: list) -> str:
+    """
+    Summarize dropped turns as one line per question and the start of its answer.
+
+    Parameters:
+    turns (list): The dropped turns, oldest first.
+
+    Returns:
+    str: The summary text.
+    """
+    lines = [f"Summary of {len(turns)} earlier turn(s) of this conversation:"]
+    shown = turns[-SUMMARY_MAX_TURNS:]
+    if len(shown) < len(turns):
+        lines.append(f"- ({len(turns) - len(shown)} older turn(s) not listed)")
+    for turn in shown:
+        question = _truncate(_first_text(turn, "user"), SUMMARY_SNIPPET_CHARS)
+        answer = _truncate(_first_text(turn, "assistant"), SUMMARY_SNIPPET_CHARS)
+        lines.append(f"- Q: {question}" + (f" / A: {answer}" if answer else ""))
+    return "\n".join(lines)
+
+
+def window_history(messages: list, budget: int = HISTORY_TOKEN_BUDGET, keep_turns: int = HISTORY_KEEP_TURNS, summary: bool = HISTORY_SUMMARY) -> list:
+    """
+    Fit serialized messages into a token budget.
+
+    The last keep_turns turns are kept verbatim (the current question is always in the
+    last one), older turns are compacted, and the oldest compacted turns are dropped
+    until the estimate fits. If the recent turns alone are over budget they are
+    compacted as well, except for the current turn, which is always sent unchanged.
+    The summary of dropped turns is capped at SUMMARY_MAX_TURNS lines on top of the budget.
+
+    Parameters:
+    messages (list): Message dicts in chronological order.
+    budget (int): The estimated token budget for the whole history.
+    keep_turns (int): How many recent turns to keep verbatim.
+    summary (bool): Whether dropped turns are recalled in a summary.
+
+    Returns:
+    list: The message dicts to send.
+    """
+    turns = split_turns(messages)
+    if not turns:
+        return []
+    keep_turns = max(keep_turns, 1)
+    recent = turns[-keep_turns:]
+    older = [[compact_message(m) for m in turn] for turn in turns[:-keep_turns]]
+
+    def size(turn):
+        return sum(estimate_tokens(m) for m in turn)
+
+    older_sizes = [size(turn) for turn in older]
+    recent_size = sum(size(turn) for turn in recent)
+    if sum(older_sizes) + recent_size > budget and len(recent) > 1:
+        older += [[compact_message(m) for m in turn] for turn in recent[:-1]]
+        older_sizes += [size(turn) for turn in older[len(older_sizes):]]
+        recent = recent[-1:]
+        recent_size = size(recent[0])
+
+    # Drop the oldest turns until the rest fits
+    total = sum(older_sizes) + recent_size
+    start = 0
+    while start < len(older) and total > budget:
+        total -= older_sizes[start]
+        start += 1
+    dropped = turns[:start]
+
+    window = [m for turn in older[start:] + recent for m in turn]
+    if dropped and summary:
+        note = {"type": "text", "text": summarize_turns(dropped)}
+        first = window[0]
+        window[0] = {**first, "content": [note] + list(first.get("content") or [])}
+    return window
+
+
+def window_messages(messages: list) -> list:
+    """
+    Build the bounded message list for an agent :run request.
+
+    Parameters:
+    messages (list[Message]): The full conversation from the session.
+
+    Returns:
+    list[Message]: The windowed conversation.
+    """
+    windowed = window_history([message.to_dict() for message in messages])
+    return [Message.from_dict(message) for message in windowed]
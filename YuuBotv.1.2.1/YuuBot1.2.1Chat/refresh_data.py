@@ -1,23 +1,35 @@
 import snowflake.connector
 import requests
 import re
+import json
+import os
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 from scrapy.selector import Selector
 from scrapy.http import HtmlResponse
 from bs4 import BeautifulSoup
+from warehouse_metrics import execute_tracked, metrics_snapshot
+
+# Written after each successful ingest; the chat app keys its answer cache on it.
+# The web app's background refresh (YuuBot1.2.1Web) writes the same file.
+DATA_VERSION_FILE = os.getenv(
+    "YUUBOT_DATA_VERSION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_version.json"),
+)
 
 url = "https://typhoon.yahoo.co.jp/weather/jp/earthquake/list/"
 html = requests.get(url).text
 response = HtmlResponse(url=url, body=html, encoding='utf-8')
 selector = Selector(response).xpath('/html/body/div[@id="wrapper"]/div[@id="contents"]/div[@id="contents-body"]/div[@id="main"]/div[@class="yjw_main_md"]/div[@id="eqhist"]/table/tr/td').getall()[4:]
 
-def create_snowflake_connection(schema):
+def create_snowflake_connection(schema, query_tag=None):
     """
     Create and return a Snowflake connection object.
 
     Parameters:
     schema (str): The schema to connect to.
+    query_tag (str): Optional QUERY_TAG for every statement on this connection,
+        naming the pipeline stage that issued it.
 
     Returns:
     snowflake.connector.connection.SnowflakeConnection: A Snowflake connection object.
@@ -31,7 +43,8 @@ def create_snowflake_connection(schema):
             account="[YOUR SNOWFLAKE ACCOUNT HERE]",
             warehouse="EARTHQUAKE_WH_XS",
             database="YUUBOT_DB",
-            schema=schema
+            schema=schema,
+            session_parameters={"QUERY_TAG": query_tag} if query_tag else None
         )
         
         return conn
@@ -92,12 +105,13 @@ def get_usgs_earthquakes_from_past_week():
             location = quake.get('properties', {}).get('place', 'N/A')
             date = convert_timestamp_to_date(int(quake.get('properties', {}).get('time', 'N/A'))).split(" ")[0]
             time = convert_timestamp_to_date(int(quake.get('properties', {}).get('time', 'N/A'))).split(" ")[1]
+            event_ts = f"{date} {time}"
             title = quake.get('properties', {}).get('title', 'N/A')
             tsunami = check_tsunami(quake.get('properties', {}).get('tsunami', 'N/A'))
             coordinates = quake.get('geometry', {}).get('coordinates', [None, None])
             lon = coordinates[0] if len(coordinates) > 0 else None
             lat = coordinates[1] if len(coordinates) > 1 else None
-            all_quakes.append((date, time, magnitude, location, title, tsunami, lat, lon))
+            all_quakes.append((date, time, magnitude, location, title, tsunami, lat, lon, event_ts))
 
         return all_quakes
 
@@ -176,9 +190,9 @@ def get_jp_quake_info_list():
     
     return quake_info_list
 
-def global_or_jp(schema, ins_cur):
+def global_or_jp(schema, ins_cur, tag="pipeline:refresh_data"):
     if schema == "GLOBAL":
-        ins_cur.execute("""
+        execute_tracked(ins_cur, tag, """
             CREATE OR REPLACE TABLE all_earthquakes_week (
                 date STRING,
                 time STRING,
@@ -187,24 +201,30 @@ def global_or_jp(schema, ins_cur):
                 title STRING,
                 tsunami BOOLEAN,
                 lat FLOAT,
-                lon FLOAT
+                lon FLOAT,
+                event_ts TIMESTAMP_NTZ
             )
+            CLUSTER BY (TO_DATE(event_ts))
         """)
 
         data_to_insert = get_usgs_earthquakes_from_past_week()
-        insert_sql = "INSERT INTO all_earthquakes_week (date, time, magnitude, location, title, tsunami, lat, lon) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
-        ins_cur.executemany(insert_sql, data_to_insert)
+        # Insert newest first so micro-partitions are written in event_ts order
+        data_to_insert.sort(key=lambda row: row[8] or "", reverse=True)
+        insert_sql = "INSERT INTO all_earthquakes_week (date, time, magnitude, location, title, tsunami, lat, lon, event_ts) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        execute_tracked(ins_cur, tag, insert_sql, data_to_insert, many=True)
     elif schema == "JP":
-        ins_cur.execute("""
+        execute_tracked(ins_cur, tag, """
             CREATE OR REPLACE TABLE all_jp_earthquakes (
                 date STRING,
                 time STRING,
                 epicenter STRING,
-                magnitude STRING,
+                magnitude FLOAT,
                 intensity STRING,
                 lat FLOAT,
-                lon FLOAT
+                lon FLOAT,
+                event_ts TIMESTAMP_NTZ
             )
+            CLUSTER BY (TO_DATE(event_ts))
         """)
     
         data_dicts = get_jp_quake_info_list()
@@ -218,24 +238,53 @@ def global_or_jp(schema, ins_cur):
                 d.get("intensity"),
                 float(d.get("latitude")) if d.get("latitude") not in (None, '') else None,
                 float(d.get("longitude")) if d.get("longitude") not in (None, '') else None,
+                f"{d.get('date')} {d.get('time')}" if d.get("date") and d.get("time") else None,
             ))
-        insert_sql = "INSERT INTO all_jp_earthquakes (date, time, epicenter, magnitude, intensity, lat, lon) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-        ins_cur.executemany(insert_sql, data_to_insert)
+        data_to_insert.sort(key=lambda row: row[7] or "", reverse=True)
+        insert_sql = "INSERT INTO all_jp_earthquakes (date, time, epicenter, magnitude, intensity, lat, lon, event_ts) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+        execute_tracked(ins_cur, tag, insert_sql, data_to_insert, many=True)
     else:
         print("Invalid schema specified. Use 'GLOBAL' or 'JP'.")
 
+def write_data_version(schema):
+    """
+    Record a successful ingest of schema in the data version file.
+
+    The file maps each schema to the time of its last ingest and is replaced
+    atomically, so readers never see a partial write.
+
+    Parameters:
+    schema (str): The schema that was refreshed.
+    """
+    try:
+        with open(DATA_VERSION_FILE, encoding="utf-8") as fh:
+            versions = json.load(fh)
+    except (OSError, ValueError):
+        versions = {}
+    versions[schema] = datetime.now().isoformat(timespec="microseconds")
+    # Per-process temp file: the web app's refresh writes the same file
+    tmp_path = f"{DATA_VERSION_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(versions, fh, sort_keys=True)
+        os.replace(tmp_path, DATA_VERSION_FILE)
+    except OSError as e:
+        print(f"Error writing data version file: {e}")
+
 def insert_overall_data_to_snowflake(schema):
-    the_conn = create_snowflake_connection(schema)
+    tag = f"pipeline:refresh_data_{schema.lower()}"
+    the_conn = create_snowflake_connection(schema, query_tag=tag)
 
     try:
         # 2. Create a cursor object
         cur = the_conn.cursor()
 
         # 3. Insert data based on schema
-        global_or_jp(schema, cur)
+        global_or_jp(schema, cur, tag)
 
         # 4. Commit the transaction
         the_conn.commit()
+        write_data_version(schema)
 
         print(f"{cur.rowcount} records inserted successfully.")
     except snowflake.connector.Error as e:
@@ -254,3 +303,4 @@ def insert_overall_data_to_snowflake(schema):
 if __name__ == "__main__":
     insert_overall_data_to_snowflake("GLOBAL")
     insert_overall_data_to_snowflake("JP")
+    print(json.dumps({"event": "warehouse_summary", "tags": metrics_snapshot()}))
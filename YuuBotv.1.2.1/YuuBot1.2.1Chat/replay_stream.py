@@ -0,0 +1,343 @@
+"""
+Replay recorded or synthetic agent streams through the chat app's rendering, offline.
+
+Usage:
+    python replay_stream.py                               # synthetic ~2 MB tool-heavy answer
+    python replay_stream.py --synthetic-mb 8
+    python replay_stream.py recordings/*.sse --speed 1    # recorded streams at their original pace
+    python replay_stream.py --no-memory --json            # timings without tracemalloc, as JSON
+
+Recordings are made by running the app with YUUBOT_RECORD_DIR set (stream_recorder.py).
+Streamlit and Weave are replaced by stub modules that only count element calls, so no
+browser, agent or W&B account is needed. Each stream is cut into its recorded chunks
+(or --chunk-size pieces), parsed with sse_parser and fed through stream_events one event
+at a time; the resulting conversation is then drawn with render_message twice (the first
+render and a rerun) and the recorded events go through analyze_events.
+
+Reported per event type: parse time, render time, Streamlit calls and the peak memory
+allocated while rendering one event. Memory tracking slows everything down; use
+--no-memory for timings alone.
+"""
+
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import types
+from collections import Counter, defaultdict
+
+from sse_parser import SSEParser
+from stream_recorder import load_recording
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_APP = os.path.join(APP_DIR, "yuubot_1.2.1_chat.py")
+SYNTHETIC_CHUNK_INTERVAL = 0.02  # seconds between synthetic chunks when --speed is set
+
+
+class StubBackend:
+    """Counts Streamlit element calls, attributed to the event being rendered."""
+
+    def __init__(self):
+        self.current = "startup"
+        self.calls = defaultdict(Counter)
+
+    def record(self, name: str) -> None:
+        self.calls[self.current][name] += 1
+
+
+class _Element:
+    # Stands in for every element, container, placeholder and context manager
+    def __init__(self, backend: StubBackend):
+        self._backend = backend
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        backend = self._backend
+
+        def element(*args, **kwargs):
+            backend.record(name)
+            return _Element(backend)
+
+        return element
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _SessionState(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+def install_stubs(backend: StubBackend) -> None:
+    """Register stub streamlit and weave modules (and dotenv/sseclient if not installed)."""
+    st = types.ModuleType("streamlit")
+    st.session_state = _SessionState()
+    st.sidebar = _Element(backend)
+    st.chat_input = lambda *args, **kwargs: None
+    st.button = lambda *args, **kwargs: False
+    # Module-level __getattr__: any other st.<element>(...) is counted
+    st.__getattr__ = lambda name: getattr(_Element(backend), name)
+    sys.modules["streamlit"] = st
+
+    weave = types.ModuleType("weave")
+    weave.init = lambda *args, **kwargs: types.SimpleNamespace(add_cost=lambda **kw: None)
+    weave.op = lambda *args, **kwargs: (lambda fn: fn)
+    sys.modules["weave"] = weave
+
+    for name, attrs in (("dotenv", {"load_dotenv": lambda *args, **kwargs: False}), ("sseclient", {})):
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            module = types.ModuleType(name)
+            module.__dict__.update(attrs)
+            sys.modules[name] = module
+
+
+def load_app(path: str):
+    """Import the chat app module from its file, with the stubs in place."""
+    app_dir = os.path.dirname(os.path.abspath(path))
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    spec = importlib.util.spec_from_file_location("yuubot_chat_replay", path)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+
+def synthetic_stream(size_mb: float, chunk_size: int, seed: int = 7) -> list:
+    """
+    Build a model-valid agent answer of roughly size_mb: thinking, tool calls, tables,
+    charts and long streamed text, ending with the final response event.
+
+    Returns:
+    list: (offset_seconds, bytes) chunks.
+    """
+    rng = random.Random(seed)
+    words = ["magnitude", "epicenter", "Tokyo", "intensity", "depth", "tsunami", "震度", "弱", "強", "km"]
+    frames = []
+    final_content = []
+    row_type = [
+        {"name": "EVENT_TS", "type": "timestamp_ntz", "length": 0, "precision": 0, "scale": 9, "nullable": True},
+        {"name": "MAGNITUDE", "type": "fixed", "length": 0, "precision": 3, "scale": 1, "nullable": True},
+        {"name": "LOCATION", "type": "text", "length": 256, "precision": 0, "scale": 0, "nullable": True},
+    ]
+
+    def emit(event, data):
+        frames.append(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    target = int(size_mb * 1024 * 1024)
+    segment = 0
+    while sum(len(frame) for frame in frames) < target:
+        base = segment * 5
+        tool_use_id = f"toolu_{segment}"
+        emit("response.status", {"status": "planning", "message": "Planning the next steps"})
+        thinking = []
+        for _ in range(40):
+            piece = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4))) + " "
+            thinking.append(piece)
+            emit("response.thinking.delta", {"content_index": base, "text": piece})
+        emit("response.thinking", {"content_index": base, "text": "".join(thinking)})
+        emit("response.status", {"status": "executing_tool", "message": "Running SQL..."})
+        emit("response.tool_use", {"content_index": base + 1, "tool_use_id": tool_use_id, "type": "cortex_analyst_text2sql",
+                                   "name": "JP_QUAKE_LOGGER", "input": {"query": "latest quakes"}})
+        rows = [[f"{1700000000 + i * 60}.000000000", f"{rng.uniform(1, 7):.1f}", rng.choice(words)] for i in range(rng.randint(200, 2000))]
+        emit("response.tool_result", {"content_index": base + 2, "tool_use_id": tool_use_id, "type": "cortex_analyst_text2sql",
+                                      "name": "JP_QUAKE_LOGGER", "status": "success",
+                                      "content": [{"type": "json", "json": {"sql": "SELECT ...", "rows": len(rows)}}]})
+        result_set = {"statementHandle": f"stmt-{segment}", "data": rows,
+                      "resultSetMetaData": {"partition": 0, "numRows": len(rows), "format": "jsonv2", "rowType": row_type}}
+        emit("response.table", {"content_index": base + 3, "tool_use_id": tool_use_id, "query_id": f"q{segment}", "result_set": result_set})
+        spec = json.dumps({"mark": "bar", "encoding": {"x": {"field": "MAGNITUDE", "bin": True}, "y": {"aggregate": "count"}},
+                           "data": {"values": [{"MAGNITUDE": float(row[1])} for row in rows[:200]]}})
+        emit("response.chart", {"content_index": base + 4, "tool_use_id": tool_use_id, "chart_spec": spec})
+        text = []
+        for _ in range(300):
+            piece = " ".join(rng.choice(words) for _ in range(rng.randint(1, 6))) + " "
+            text.append(piece)
+            emit("response.text.delta", {"content_index": base + 5, "text": piece})
+        final_content += [
+            {"type": "table", "table": {"tool_use_id": tool_use_id, "query_id": f"q{segment}", "result_set": result_set}},
+            {"type": "chart", "chart": {"tool_use_id": tool_use_id, "chart_spec": spec}},
+            {"type": "text", "text": "".join(text)},
+        ]
+        segment += 1
+    emit("response", {"role": "assistant", "content": final_content, "metadata": {"usage": {"tokens_consumed": [
+        {"model_name": "claude-4-sonnet", "input_tokens": {"total": 12000, "cache_read": 8000}, "output_tokens": {"total": 900}}]}}})
+
+    payload = b"".join(frames)
+    return [(i // chunk_size * SYNTHETIC_CHUNK_INTERVAL, payload[i:i + chunk_size]) for i in range(0, len(payload), chunk_size)]
+
+
+def _new_stats():
+    return {"events": 0, "bytes": 0, "parse_s": 0.0, "render_s": 0.0, "peak_bytes": 0}
+
+
+def replay(app, backend: StubBackend, chunks: list, speed: float, track_memory: bool) -> dict:
+    """
+    Feed one stream through stream_events and the history renderer.
+
+    Parameters:
+    app (module): The loaded chat app.
+    backend (StubBackend): The stub backend counting element calls.
+    chunks (list): (offset_seconds, bytes) pieces of the stream.
+    speed (float): 0 for as fast as possible, otherwise a multiple of the recorded pace.
+    track_memory (bool): Whether to measure peak allocations with tracemalloc.
+
+    Returns:
+    dict: Per-event-type stats, plus the wall time.
+    """
+    stats = defaultdict(_new_stats)
+    parser = SSEParser()
+    app.st.session_state.clear()
+    app.st.session_state.messages = [app.Message(role="user", content=[app.MessageContentItem(app.TextContentItem(type="text", text="replay"))])]
+
+    def measure_start():
+        if track_memory:
+            tracemalloc.reset_peak()
+            return time.perf_counter(), tracemalloc.get_traced_memory()[0]
+        return time.perf_counter(), 0
+
+    def measure_end(entry, started):
+        entry["render_s"] += time.perf_counter() - started[0]
+        if track_memory:
+            entry["peak_bytes"] = max(entry["peak_bytes"], tracemalloc.get_traced_memory()[1] - started[1])
+
+    # The event whose rendering is being measured: stream_events may stop early (on an
+    # error event) without resuming the generator, and draws the final flush after it ends
+    open_entry = {}
+
+    def events():
+        start = time.perf_counter()
+        pending_parse = 0.0
+        for offset, chunk in chunks + [(None, None)]:
+            if speed and offset is not None:
+                delay = offset / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.perf_counter()
+            parsed = parser.feed(chunk) if chunk is not None else parser.finish()
+            pending_parse += time.perf_counter() - t0
+            if not parsed:
+                continue
+            # Parse time is shared among the events a chunk completed, by size
+            total = sum(len(event.data) + 1 for event in parsed)
+            for event in parsed:
+                entry = stats[event.event]
+                entry["events"] += 1
+                entry["bytes"] += len(event.data)
+                entry["parse_s"] += pending_parse * (len(event.data) + 1) / total
+                backend.current = event.event
+                open_entry.update(entry=entry, started=measure_start())
+                yield event
+                measure_end(open_entry.pop("entry"), open_entry.pop("started"))
+            pending_parse = 0.0
+        backend.current = "(end of stream)"
+        stats["(end of stream)"]["events"] += 1
+        open_entry.update(entry=stats["(end of stream)"], started=measure_start())
+
+    wall = time.perf_counter()
+    recorded = app.stream_events(events())
+    if open_entry:
+        measure_end(open_entry.pop("entry"), open_entry.pop("started"))
+    wall = time.perf_counter() - wall
+
+    messages = app.st.session_state.messages
+    for label in ("render_message (first)", "render_message (rerun)"):
+        backend.current = label
+        entry = stats[label]
+        entry["events"] += len(messages)
+        started = measure_start()
+        for index, message in enumerate(messages):
+            app.render_message(message, index)
+        measure_end(entry, started)
+
+    backend.current = "analyze_events"
+    entry = stats["analyze_events"]
+    entry["events"] += len(recorded)
+    started = measure_start()
+    app.analyze_events(recorded)
+    measure_end(entry, started)
+    return {"stats": stats, "stream_wall_s": wall}
+
+
+def print_report(name: str, result: dict, backend: StubBackend) -> None:
+    stats = result["stats"]
+    print(f"{name}: streamed in {result['stream_wall_s'] * 1000:.1f} ms")
+    print(f"  {'event type':28s} {'events':>7s} {'KB':>9s} {'parse ms':>9s} {'render ms':>10s} {'st calls':>9s} {'peak KB':>8s}")
+    for event_type, entry in stats.items():
+        calls = sum(backend.calls[event_type].values())
+        print(f"  {event_type:28s} {entry['events']:7d} {entry['bytes'] / 1024:9.1f} {entry['parse_s'] * 1000:9.2f} "
+              f"{entry['render_s'] * 1000:10.2f} {calls:9d} {entry['peak_bytes'] / 1024:8.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="recorded .sse streams")
+    parser.add_argument("--app", default=DEFAULT_APP, help="chat app module to drive")
+    parser.add_argument("--synthetic-mb", type=float, default=2.0, help="size of the synthetic stream")
+    parser.add_argument("--chunk-size", type=int, default=8192, help="bytes per chunk for synthetic or untimed streams")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 = as fast as possible, 1 = recorded pace, 2 = twice as fast")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (cleaner timings)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    backend = StubBackend()
+    install_stubs(backend)
+    app = load_app(args.app)
+
+    if args.files:
+        streams = []
+        for path in args.files:
+            chunks = load_recording(path)
+            if len(chunks) == 1:
+                payload = chunks[0][1]
+                chunks = [(0.0, payload[i:i + args.chunk_size]) for i in range(0, len(payload), args.chunk_size)]
+            streams.append((path, chunks))
+    else:
+        streams = [(f"synthetic {args.synthetic_mb:g} MB", synthetic_stream(args.synthetic_mb, args.chunk_size))]
+
+    if not args.no_memory:
+        tracemalloc.start()
+    results = {}
+    for name, chunks in streams:
+        backend.calls.clear()
+        result = replay(app, backend, chunks, args.speed, not args.no_memory)
+        if args.json:
+            results[name] = {
+                "stream_wall_ms": round(result["stream_wall_s"] * 1000, 2),
+                "events": {
+                    event_type: {
+                        "events": entry["events"],
+                        "bytes": entry["bytes"],
+                        "parse_ms": round(entry["parse_s"] * 1000, 3),
+                        "render_ms": round(entry["render_s"] * 1000, 3),
+                        "st_calls": dict(backend.calls[event_type]),
+                        "peak_bytes": entry["peak_bytes"],
+                    }
+                    for event_type, entry in result["stats"].items()
+                },
+            }
+        else:
+            print_report(name, result, backend)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import json
+import os
+import time
+import uuid
+
+# Records agent :run streams for offline benchmarking (replay_stream.py,
+# bench_sse_parser.py). With YUUBOT_RECORD_DIR set, every streamed response is
+# copied to <dir>/<timestamp>-<request id>.sse exactly as it came off the
+# socket, next to a .timing.json holding the arrival offset and size of each
+# chunk, so a replay can reproduce the original pacing.
+RECORD_DIR = os.getenv("YUUBOT_RECORD_DIR")
+
+
+def record_stream(response, directory: str | None = RECORD_DIR):
+    """
+    Tee a streaming response's raw bytes to a recording, if recording is enabled.
+
+    The response is returned with its iter_content wrapped; the bytes seen by the
+    caller are unchanged. Offsets are measured from when the response headers arrived.
+
+    Parameters:
+    response (requests.Response): A streaming response from agent_run.
+    directory (str | None): Where to write recordings; None disables recording.
+
+    Returns:
+    requests.Response: The same response.
+    """
+    if not directory:
+        return response
+    os.makedirs(directory, exist_ok=True)
+    request_id = response.headers.get("X-Snowflake-Request-Id") or uuid.uuid4().hex
+    base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id}")
+    started_at = time.perf_counter()
+    original = response.iter_content
+
+    def iter_content(chunk_size=1, decode_unicode=False):
+        timing = []
+        try:
+            with open(f"{base}.sse", "wb") as fh:
+                for chunk in original(chunk_size=chunk_size, decode_unicode=decode_unicode):
+                    raw = chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+                    fh.write(raw)
+                    timing.append([round(time.perf_counter() - started_at, 4), len(raw)])
+                    yield chunk
+        finally:
+            # Also written when the stream is abandoned early, e.g. on an error event
+            with open(f"{base}.timing.json", "w", encoding="utf-8") as fh:
+                json.dump({"request_id": request_id, "chunks": timing}, fh)
+
+    response.iter_content = iter_content
+    return response
+
+
+def load_recording(path: str):
+    """
+    Read a recorded stream as its original chunks.
+
+    Parameters:
+    path (str): The .sse file.
+
+    Returns:
+    list: (offset_seconds, bytes) per chunk. Without a .timing.json next to the
+    file, the whole stream is one chunk at offset 0.
+    """
+    with open(path, "rb") as fh:
+        payload = fh.read()
+    timing_path = f"{os.path.splitext(path)[0]}.timing.json"
+    if not os.path.exists(timing_path):
+        return [(0.0, payload)]
+    with open(timing_path, encoding="utf-8") as fh:
+        timing = json.load(fh).get("chunks", [])
+    chunks = []
+    position = 0
+    for offset, size in timing:
+        chunks.append((offset, payload[position:position + size]))
+        position += size
+    if position < len(payload):
+        chunks.append((timing[-1][0] if timing else 0.0, payload[position:]))
+    return chunks
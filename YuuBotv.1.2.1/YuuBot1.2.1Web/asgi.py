@@ -0,0 +1,211 @@
+import asyncio
+import importlib.util
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+# ASGI entry point: uvicorn asgi:application --host 0.0.0.0 --port 4092
+#
+# /events is served natively: each subscriber is a coroutine that steps the
+# same SSE generator as the Flask route (change_feed.sse_stream) and awaits the
+# poll interval in between, so it holds neither a thread nor a slot in the
+# request pool for as long as the page is open. Every other request runs the
+# Flask app on a bounded thread pool, so a burst of viewers queues for a worker
+# instead of spawning threads without limit, and requests beyond the queue
+# bound get a 503. The refresh scheduler, the change poller and the pool are
+# started and stopped by the lifespan hooks.
+ASGI_WORKERS = int(os.getenv("YUUBOT_ASGI_WORKERS", "32"))
+ASGI_MAX_PENDING = int(os.getenv("YUUBOT_ASGI_MAX_PENDING", "256"))
+
+# Tell the Flask module not to start the scheduler on import; the lifespan hook owns it here
+os.environ["YUUBOT_ASGI"] = "1"
+
+_app_dir = os.path.dirname(os.path.abspath(__file__))
+if _app_dir not in sys.path:
+    sys.path.insert(0, _app_dir)
+_spec = importlib.util.spec_from_file_location("yuubot_app", os.path.join(_app_dir, "yuubot_1.2.1_app.py"))
+yuubot_app = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(yuubot_app)
+
+from snowflake_data.change_feed import parse_subscription, sse_stream
+
+_executor = None
+_pending = 0
+
+
+def _build_environ(scope, body):
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            key = name
+        else:
+            key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(environ):
+    # Runs on a pool thread: the whole Flask request, including warehouse calls, happens here
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+        return chunks.append
+
+    result = yuubot_app.app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], b"".join(chunks)
+
+
+async def _send_simple(send, status, body, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _serve_wsgi(scope, receive, send):
+    global _pending
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    if _pending >= ASGI_MAX_PENDING:
+        await _send_simple(send, 503, b'{"error": "server busy"}', [(b"retry-after", b"1")])
+        return
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(_executor, _call_wsgi, _build_environ(scope, body))
+    finally:
+        _pending -= 1
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    })
+    await send({"type": "http.response.body", "body": content})
+
+
+async def _serve_events(scope, receive, send):
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+    schema, last_id = parse_subscription(
+        query.get("schema", [None])[0],
+        headers.get("last-event-id") or query.get("last_event_id", [None])[0],
+    )
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                return
+
+    # The same generator as the Flask route. Each step is short and runs on a worker thread
+    # (not the request pool); the waits between steps are awaited here, holding no thread
+    stream = sse_stream(yuubot_app.change_poller, schema, last_id)
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        while not disconnected.is_set():
+            chunk = await asyncio.to_thread(next, stream)
+            if chunk is not None:
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+                continue
+            try:
+                await asyncio.wait_for(disconnected.wait(), timeout=yuubot_app.SSE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        watcher.cancel()
+        stream.close()
+
+
+async def _lifespan(receive, send):
+    global _executor
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                _executor = ThreadPoolExecutor(max_workers=ASGI_WORKERS, thread_name_prefix="yuubot-asgi")
+                # The first poll reads the change log, so subscribers have a snapshot from the start
+                await asyncio.to_thread(yuubot_app.change_poller.start)
+                if os.getenv("YUUBOT_REFRESH_SCHEDULER", "1") == "1":
+                    yuubot_app.refresh_scheduler.start()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Let an in-progress refresh finish its transaction, then drain the request pool
+            await asyncio.to_thread(yuubot_app.refresh_scheduler.stop, 60)
+            await asyncio.to_thread(yuubot_app.change_poller.stop, 5)
+            await asyncio.to_thread(_executor.shutdown, True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    elif scope["type"] == "http":
+        if _executor is None:
+            # The server was started without lifespan support; nothing would run the Flask app
+            await _send_simple(send, 503, b'{"error": "server is not started"}')
+        elif scope["path"] == "/events" and scope["method"] == "GET":
+            await _serve_events(scope, receive, send)
+        else:
+            await _serve_wsgi(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(application, host='0.0.0.0', port=4092, lifespan="on", timeout_graceful_shutdown=10)
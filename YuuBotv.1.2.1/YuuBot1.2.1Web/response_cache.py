@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import os
+
+from flask import Response, g, request
+
+from snowflake_data.query_cache import QueryCache
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# HTTP validation and compression for the read routes. Everything they return
+# is a function of the URL and the replica data versions, so a strong ETag is
+# derived from exactly those: a poll that arrives with a matching
+# If-None-Match is answered 304 before the view runs, and the encoded body of
+# each (ETag, encoding) pair is kept so repeat requests skip the view,
+# serialization and compression altogether. Nothing is validated while the
+# replica is empty (version 0), since warehouse reads are not versioned.
+COMPRESS_MIN_BYTES = int(os.getenv("YUUBOT_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Not replayed from a cache entry: hop-by-hop headers, and the ones derived from the stored
+# body and validators. Everything else a view set (e.g. X-Next-Cursor) is kept with the body.
+_UNCACHED_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+    "transfer-encoding", "upgrade", "content-length", "content-type", "content-encoding",
+    "etag", "vary", "cache-control", "set-cookie",
+}
+
+encoded_cache = QueryCache(max_entries=int(os.getenv("YUUBOT_RESPONSE_CACHE_SIZE", "128")))
+
+
+def _source_fingerprint(paths):
+    # Changes whenever the code or templates that render the bodies are redeployed,
+    # and is the same in every worker process
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names)
+        else:
+            files.append(path)
+    digest = hashlib.sha1()
+    for file_path in sorted(files):
+        try:
+            with open(file_path, "rb") as fh:
+                digest.update(fh.read())
+        except OSError:
+            continue
+    return digest.hexdigest()[:12]
+
+
+def _choose_encoding(accept_encoding):
+    if brotli is not None and "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return "identity"
+
+
+def _encode(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def _set_validators(response, etag, encoding):
+    response.set_etag(etag)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    # Let clients keep the body but revalidate it on every use
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def init_response_cache(app, versions_fn, excluded_paths=(), source_paths=()):
+    """
+    Add ETag validation and cached compression to a Flask app's GET routes.
+
+    Parameters:
+    app (flask.Flask): The app.
+    versions_fn (callable): Returns the data versions the responses depend on, as a tuple of ints.
+    excluded_paths (tuple): Paths that are never validated or cached, e.g. streams and live counters.
+    source_paths (tuple): Files or directories whose contents are folded into every ETag.
+    """
+    salt = _source_fingerprint(source_paths)
+
+    def eligible():
+        return (
+            request.method == "GET"
+            and request.endpoint not in (None, "static")
+            and request.path not in excluded_paths
+            # ?force=1 triggers a refresh; it must always reach the view
+            and request.args.get("force") != "1"
+        )
+
+    @app.before_request
+    def check_etag():
+        if not eligible():
+            return None
+        versions = versions_fn()
+        if not all(versions):
+            return None
+        encoding = _choose_encoding(request.headers.get("Accept-Encoding", ""))
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+        raw = f"{salt}|{request.path}?{query}|{'.'.join(str(version) for version in versions)}"
+        base_etag = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+        g.response_etag = (base_etag, encoding)
+
+        # Compressed and identity bodies are different representations, so their strong ETags
+        # differ by suffix; either one proves the client already has this version
+        candidates = [base_etag] if encoding == "identity" else [f"{base_etag}-{encoding}", base_etag]
+        for etag in candidates:
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                _set_validators(response, etag, "identity")
+                return response
+
+        entry = encoded_cache.get((base_etag, encoding))
+        if entry is not None:
+            body, mimetype, etag, body_encoding, headers = entry
+            response = Response(body, mimetype=mimetype, headers=headers)
+            _set_validators(response, etag, body_encoding)
+            return response
+        return None
+
+    @app.after_request
+    def encode_and_store(response):
+        etag_info = g.pop("response_etag", None)
+        if etag_info is None or response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return response
+        if "ETag" in response.headers or "Content-Encoding" in response.headers:
+            return response
+        base_etag, encoding = etag_info
+        body = response.get_data()
+        if encoding == "identity" or len(body) < COMPRESS_MIN_BYTES:
+            # Small bodies are not worth compressing
+            etag, encoding = base_etag, "identity"
+        else:
+            etag = f"{base_etag}-{encoding}"
+            body = _encode(body, encoding)
+            response.set_data(body)
+        _set_validators(response, etag, encoding)
+        headers = [(name, value) for name, value in response.headers if name.lower() not in _UNCACHED_HEADERS]
+        encoded_cache.put(etag_info, (body, response.mimetype, etag, encoding, headers))
+        return response
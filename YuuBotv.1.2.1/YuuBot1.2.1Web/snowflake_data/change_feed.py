@@ -0,0 +1,380 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+# Change log of ingested quakes, stored in the replica database. write_replica()
+# diffs every refresh against the previous replica contents and appends one
+# row per added, updated or removed quake; the /events stream and the delta
+# refresh endpoints read from here. The autoincrement id doubles as the SSE
+# event id and the delta cursor.
+CHANGE_LOG_RETENTION = int(os.getenv("YUUBOT_CHANGE_LOG_RETENTION", "5000"))
+
+SSE_BATCH_LIMIT = 500
+# An idle stream sends a comment frame this often so proxies don't close it
+SSE_KEEPALIVE_SECONDS = 15
+# A delta larger than this is sent as a full resync instead
+DELTA_LIMIT = 500
+
+CHANGE_LOG_DDL = """
+    CREATE TABLE IF NOT EXISTS quake_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        schema TEXT NOT NULL,
+        change TEXT NOT NULL,
+        event_key TEXT NOT NULL,
+        payload TEXT,
+        created_at TEXT NOT NULL
+    )
+"""
+
+
+def quake_key(row):
+    """
+    Return a stable identity for a quake row dict.
+
+    The source feeds are stored without their upstream ids, so a quake is identified
+    by its timestamp and coordinates rounded to ~1km; magnitude and place text may
+    be revised between refreshes and would count as an update.
+    """
+    lat = row.get("lat")
+    lon = row.get("lon")
+    return "|".join([
+        str(row.get("event_ts")),
+        f"{lat:.2f}" if lat is not None else "",
+        f"{lon:.2f}" if lon is not None else "",
+    ])
+
+
+def record_changes(conn, schema, columns, old_rows, new_rows):
+    """
+    Diff two snapshots of a schema's quake table and append the differences to the change log.
+
+    Must be called inside the replica write transaction so the log and the table stay consistent.
+    Nothing is logged when old_rows is empty, i.e. on the initial load.
+
+    Parameters:
+    conn (sqlite3.Connection): The replica connection.
+    schema (str): "GLOBAL" or "JP".
+    columns (list): Column names of the row tuples.
+    old_rows (list): Rows before the refresh.
+    new_rows (list): Rows after the refresh.
+
+    Returns:
+    int: The number of changes recorded.
+    """
+    if not old_rows:
+        return 0
+
+    old = {}
+    for row in old_rows:
+        as_dict = dict(zip(columns, row))
+        old[quake_key(as_dict)] = as_dict
+    new = {}
+    for row in new_rows:
+        as_dict = dict(zip(columns, row))
+        new[quake_key(as_dict)] = as_dict
+
+    now = datetime.now(timezone.utc).isoformat()
+    changes = []
+    for key, quake in new.items():
+        previous = old.get(key)
+        if previous is None:
+            changes.append((schema, "added", key, json.dumps(quake), now))
+        elif previous != quake:
+            changes.append((schema, "updated", key, json.dumps(quake), now))
+    for key in old.keys() - new.keys():
+        changes.append((schema, "removed", key, None, now))
+
+    if changes:
+        if conn.execute("SELECT 1 FROM quake_changes LIMIT 1").fetchone() is None:
+            # Cursors handed out while the log was empty are data versions (see change_id_bounds);
+            # start the ids above them so those clients get these changes as a normal delta
+            floor = _version_floor(conn)
+            if not conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'quake_changes'", (floor,)
+            ).rowcount:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('quake_changes', ?)", (floor,))
+        conn.executemany(
+            "INSERT INTO quake_changes (schema, change, event_key, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            changes,
+        )
+        conn.execute(
+            "DELETE FROM quake_changes WHERE id <= (SELECT MAX(id) FROM quake_changes) - ?",
+            (CHANGE_LOG_RETENTION,),
+        )
+    return len(changes)
+
+
+def read_changes(conn, after_id, schema=None, limit=500):
+    """
+    Return change log entries with an id greater than after_id, oldest first.
+
+    Returns:
+    list: Dicts with id, schema, change, key, quake (None for removals) and created_at.
+    """
+    sql = "SELECT id, schema, change, event_key, payload, created_at FROM quake_changes WHERE id > ?"
+    params = [after_id]
+    if schema:
+        sql += " AND schema = ?"
+        params.append(schema)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(limit)
+    return [
+        {
+            "id": row[0],
+            "schema": row[1],
+            "change": row[2],
+            "key": row[3],
+            "quake": json.loads(row[4]) if row[4] else None,
+            "created_at": row[5],
+        }
+        for row in conn.execute(sql, params).fetchall()
+    ]
+
+
+def _version_floor(conn):
+    # The replica's data versions (local_replica.py) live in the same database
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM data_versions").fetchone()[0]
+
+
+def change_id_bounds(conn):
+    """
+    Return (oldest retained id, newest id) of the change log.
+
+    Nothing is logged for the initial load, so the log can stay empty for a while. The
+    newest id is then the replica's highest data version instead of 0, so clients holding
+    a copy get a cursor (and an empty delta) rather than a full resync on every poll.
+    record_changes() starts the ids above it. Returns (0, 0) before the first load.
+    """
+    row = conn.execute("SELECT MIN(id), MAX(id) FROM quake_changes").fetchone()
+    if row[1] is None:
+        return (0, _version_floor(conn))
+    return (row[0], row[1])
+
+
+def read_delta(conn, since, schema):
+    """
+    Return the changes a client holding the lists as of change id `since` needs to catch up.
+
+    Parameters:
+    conn (sqlite3.Connection): The replica connection.
+    since (int): The change id the client's copy is current to.
+    schema (str): "GLOBAL" or "JP".
+
+    Returns:
+    tuple: (list of changes as returned by read_changes, new cursor). The list is None when
+        the client has to resync the full list instead: it has no copy yet, its cursor was
+        pruned or is from another replica, or the delta would be larger than DELTA_LIMIT.
+    """
+    oldest, newest = change_id_bounds(conn)
+    if since <= 0 or since > newest or (oldest and since < oldest - 1):
+        return None, newest
+    changes = read_changes(conn, since, schema=schema, limit=DELTA_LIMIT)
+    if len(changes) >= DELTA_LIMIT:
+        return None, newest
+    # A refresh may have landed after the bounds were read; never hand out a cursor behind a change we sent
+    return changes, max([newest] + [change["id"] for change in changes])
+
+
+def format_sse(data, event=None, event_id=None, retry=None):
+    """Serialize one Server-Sent Event frame."""
+    lines = []
+    if retry is not None:
+        lines.append(f"retry: {retry}")
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _resync_frames(newest):
+    return [format_sse({"latest_id": newest}, event="resync", event_id=newest)], newest
+
+
+def frames_for_changes(oldest, newest, last_id, changes):
+    """
+    Build the SSE frames a client should receive after last_id, from changes already read.
+
+    Only added and updated quakes are pushed; removals just advance the cursor. If the
+    client's last id has already been pruned from the log, or is ahead of the log because
+    the replica was recreated, a single "resync" event tells it to reload the full lists
+    and moves it to the newest id.
+
+    Parameters:
+    oldest (int): The oldest retained change id.
+    newest (int): The newest change id.
+    last_id (int): The last change id the client has seen.
+    changes (list): Changes after last_id for the client's schema, oldest first, at most SSE_BATCH_LIMIT.
+
+    Returns:
+    tuple: (list of SSE frame strings, new last id)
+    """
+    if last_id > newest:
+        return _resync_frames(newest)
+    if newest == last_id:
+        return [], last_id
+    if oldest and last_id < oldest - 1:
+        return _resync_frames(newest)
+
+    frames = []
+    for change in changes:
+        last_id = change["id"]
+        if change["change"] == "removed":
+            continue
+        frames.append(format_sse(
+            {"schema": change["schema"], "change": change["change"], "quake": change["quake"]},
+            event="quake",
+            event_id=change["id"],
+        ))
+    if len(changes) < SSE_BATCH_LIMIT:
+        # Caught up; changes for other schemas were filtered out, so skip past them too
+        last_id = max(last_id, newest)
+    return frames, last_id
+
+
+class ChangeFeedPoller:
+    """
+    One change-log poll per process, shared by every /events subscriber.
+
+    A background thread mirrors the retained change log into memory every poll_seconds,
+    and subscribers build their frames from that copy, so an open SSE connection costs
+    no query and no pool thread of its own.
+    """
+
+    def __init__(self, connect, poll_seconds):
+        """
+        Parameters:
+        connect (callable): Returns a replica connection for the calling thread.
+        poll_seconds (float): Delay between polls of the change log.
+        """
+        self.connect = connect
+        self.poll_seconds = poll_seconds
+        # (oldest, newest, changes, change ids), replaced as a whole so readers need no lock
+        self._snapshot = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Poll once, then keep polling on a background thread. Calling it again while running does nothing."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._poll_safely()
+            self._thread = threading.Thread(target=self._run, name="yuubot-change-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _poll(self):
+        conn = self.connect()
+        oldest, newest = change_id_bounds(conn)
+        snapshot = self._snapshot
+        if snapshot is not None and (oldest, newest) == snapshot[:2]:
+            return
+        if snapshot is None or newest < snapshot[1]:
+            # First poll, or the replica was recreated and its ids restarted: load the whole log
+            changes = read_changes(conn, 0, limit=CHANGE_LOG_RETENTION)
+        else:
+            kept = snapshot[2][bisect.bisect_left(snapshot[3], oldest):]
+            changes = kept + read_changes(conn, snapshot[1], limit=CHANGE_LOG_RETENTION)
+        ids = [change["id"] for change in changes]
+        # A refresh may have committed between the bounds and the read; the snapshot covers what was read
+        self._snapshot = (oldest, max([newest] + ids[-1:]), changes, ids)
+
+    def _poll_safely(self):
+        try:
+            self._poll()
+        except sqlite3.Error as e:
+            # Subscribers keep the last snapshot; the next poll retries
+            print(f"Error polling the change log: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self._poll_safely()
+
+    def latest_id(self):
+        """Return the newest change id, the cursor for a subscriber that starts now."""
+        snapshot = self._snapshot
+        return snapshot[1] if snapshot else 0
+
+    def frames_since(self, last_id, schema=None):
+        """
+        Build the SSE frames a client should receive after last_id, from the shared snapshot.
+
+        Parameters:
+        last_id (int): The last change id the client has seen.
+        schema (str | None): Only stream changes for this schema.
+
+        Returns:
+        tuple: (list of SSE frame strings, new last id)
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return [], last_id
+        oldest, newest, changes, ids = snapshot
+        after = changes[bisect.bisect_right(ids, last_id):]
+        selected = list(islice((change for change in after if not schema or change["schema"] == schema), SSE_BATCH_LIMIT))
+        return frames_for_changes(oldest, newest, last_id, selected)
+
+
+def parse_subscription(schema, last_event_id):
+    """
+    Parse the /events request arguments.
+
+    Parameters:
+    schema (str | None): The schema query argument.
+    last_event_id (str | None): The Last-Event-ID header (browsers resend it when EventSource
+        reconnects), or else the last_event_id query argument.
+
+    Returns:
+    tuple: (schema or None for every schema, last id or None for a new subscriber)
+    """
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+    return (schema or "").upper() or None, last_id
+
+
+def sse_stream(poller, schema, last_id):
+    """
+    Generate the /events stream of one subscriber, for both the Flask route and asgi.py.
+
+    Yields SSE text, and None whenever the subscriber should wait one poll interval before
+    the next step. The caller does the waiting (a sleep on its thread, or an await on the
+    event loop), so no step blocks and an idle subscriber holds no thread between steps.
+
+    Parameters:
+    poller (ChangeFeedPoller): The process's shared poller.
+    schema (str | None): Only stream changes for this schema.
+    last_id (int | None): The last change id the client has seen; None for a new subscriber.
+    """
+    poller.start()
+    if last_id is None:
+        # New subscribers only get quakes ingested from now on
+        last_id = poller.latest_id()
+    yield format_sse({"latest_id": last_id}, event="ready", event_id=last_id, retry=5000)
+    idle_since = time.monotonic()
+    while True:
+        frames, last_id = poller.frames_since(last_id, schema)
+        if frames:
+            yield "".join(frames)
+            idle_since = time.monotonic()
+        elif time.monotonic() - idle_since >= SSE_KEEPALIVE_SECONDS:
+            # Comment frame keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
+            idle_since = time.monotonic()
+        yield None
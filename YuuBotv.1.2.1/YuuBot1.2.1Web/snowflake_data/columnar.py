@@ -0,0 +1,53 @@
+try:
+    import pyarrow  # noqa: F401  (enables SnowflakeCursor.fetch_arrow_all)
+except ImportError:  # optional: fall back to fetchall() and a transpose
+    pyarrow = None
+
+# Column-oriented result handling for the coordinate routes. Results are kept
+# as one list per column: the warehouse hands them over as Arrow batches
+# (when pyarrow is installed), replica rows are transposed with a single
+# zip(), and the routes either send the columns as-is (?format=columns) or
+# zip them into records, so no per-field conversion runs in Python. The table
+# DDL already fixes the types (date/time STRING, magnitude FLOAT, tsunami
+# BOOLEAN), which is what made the old per-field str()/float()/bool() calls
+# redundant.
+
+
+def rows_to_columns(rows, width):
+    """
+    Transpose row tuples into column lists.
+
+    Parameters:
+    rows (list): The result rows.
+    width (int): The number of columns, used when there are no rows.
+
+    Returns:
+    list: One list per column.
+    """
+    if not rows:
+        return [[] for _ in range(width)]
+    return [list(column) for column in zip(*rows)]
+
+
+def fetch_columns(cur, width):
+    """
+    Fetch the rest of a Snowflake result as column lists, using Arrow batches when available.
+
+    Parameters:
+    cur (snowflake.connector.cursor.SnowflakeCursor): A cursor with an executed query.
+    width (int): The number of columns in the query.
+
+    Returns:
+    list: One list per column.
+    """
+    if pyarrow is not None and hasattr(cur, "fetch_arrow_all"):
+        table = cur.fetch_arrow_all()
+        if table is None:
+            return [[] for _ in range(width)]
+        return [table.column(i).to_pylist() for i in range(table.num_columns)]
+    return rows_to_columns(cur.fetchall(), width)
+
+
+def columns_to_records(names, columns):
+    """Zip column lists back into one dict per row, for clients that expect records."""
+    return [dict(zip(names, values)) for values in zip(*columns)]
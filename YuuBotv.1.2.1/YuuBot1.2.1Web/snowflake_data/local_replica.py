@@ -0,0 +1,273 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from snowflake_data.change_feed import CHANGE_LOG_DDL, record_changes
+from snowflake_data.quake_clusters import cluster_snapshots
+from snowflake_data.quake_stats import stats_snapshots
+
+# Embedded read replica of the Snowflake quake tables. The refresh pipeline
+# rewrites it after every successful warehouse commit, and the Flask routes
+# read from it first so that page views do not need a warehouse round trip.
+# Snowflake stays the source of truth: readers fall back to it whenever the
+# replica has not been populated yet.
+REPLICA_PATH = os.getenv(
+    "YUUBOT_REPLICA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "quakes_replica.db"),
+)
+# Replaced after every replica write. Readers keep the data versions in memory and only
+# re-read them when this file changes, so a cache hit costs a stat() instead of a query.
+VERSION_STAMP_PATH = REPLICA_PATH + ".version"
+
+REPLICA_TABLES = {
+    "GLOBAL": {
+        "table": "all_earthquakes_week",
+        "columns": ["date", "time", "magnitude", "location", "title", "tsunami", "lat", "lon", "event_ts"],
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS all_earthquakes_week (
+                date TEXT,
+                time TEXT,
+                magnitude REAL,
+                location TEXT,
+                title TEXT,
+                tsunami BOOLEAN,
+                lat REAL,
+                lon REAL,
+                event_ts TEXT
+            )
+        """,
+    },
+    "JP": {
+        "table": "all_jp_earthquakes",
+        "columns": ["date", "time", "epicenter", "magnitude", "intensity", "lat", "lon", "event_ts"],
+        "ddl": """
+            CREATE TABLE IF NOT EXISTS all_jp_earthquakes (
+                date TEXT,
+                time TEXT,
+                epicenter TEXT,
+                magnitude REAL,
+                intensity TEXT,
+                lat REAL,
+                lon REAL,
+                event_ts TEXT
+            )
+        """,
+    },
+}
+
+# Derived views computed once per refresh and stored next to the rows: map clusters and stats.
+# Each builder takes (schema, columns, rows) and returns {snapshot name: JSON payload}.
+SNAPSHOT_BUILDERS = [cluster_snapshots, stats_snapshots]
+
+# Return BOOLEAN columns (tsunami) as Python bools, the same as the Snowflake connector does
+sqlite3.register_converter("BOOLEAN", lambda value: value not in (b"0", b""))
+
+_local = threading.local()
+_version_cache = {"stamp": None, "versions": None}
+_version_lock = threading.Lock()
+
+
+def _connect():
+    conn = sqlite3.connect(REPLICA_PATH, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+    # WAL lets the routes keep reading while a refresh rewrites the tables
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS replica_meta (
+            schema TEXT PRIMARY KEY,
+            refreshed_at TEXT,
+            row_count INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            schema TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS replica_snapshots (
+            schema TEXT NOT NULL,
+            name TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            PRIMARY KEY (schema, name)
+        )
+    """)
+    conn.execute(CHANGE_LOG_DDL)
+    for spec in REPLICA_TABLES.values():
+        conn.execute(spec["ddl"])
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{spec['table']}_event_ts ON {spec['table']} (event_ts DESC)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{spec['table']}_magnitude ON {spec['table']} (magnitude)")
+    conn.commit()
+    return conn
+
+
+def get_replica_connection():
+    """
+    Return this thread's connection to the replica, opening it on first use.
+
+    Returns:
+    sqlite3.Connection: A connection to the local replica database.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+
+def write_replica(schema, rows):
+    """
+    Replace the replica copy of a schema's quake table with freshly ingested rows.
+
+    Parameters:
+    schema (str): "GLOBAL" or "JP".
+    rows (list): Row tuples in the same column order as the warehouse INSERT.
+
+    Returns:
+    bool: True once the rows are committed, False if the write failed and was rolled back.
+    """
+    spec = REPLICA_TABLES[schema]
+    placeholders = ", ".join("?" for _ in spec["columns"])
+    conn = get_replica_connection()
+    try:
+        with conn:
+            old_rows = conn.execute(f"SELECT {', '.join(spec['columns'])} FROM {spec['table']}").fetchall()
+            record_changes(conn, schema, spec["columns"], old_rows, rows)
+            conn.execute(f"DELETE FROM {spec['table']}")
+            conn.executemany(
+                f"INSERT INTO {spec['table']} ({', '.join(spec['columns'])}) VALUES ({placeholders})",
+                rows,
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO replica_meta (schema, refreshed_at, row_count) VALUES (?, ?, ?)",
+                (schema, datetime.now(timezone.utc).isoformat(), len(rows)),
+            )
+            # Bump the data version in the same transaction so cached results keyed on it expire atomically
+            conn.execute(
+                "INSERT INTO data_versions (schema, version) VALUES (?, 1) "
+                "ON CONFLICT (schema) DO UPDATE SET version = version + 1",
+                (schema,),
+            )
+            version = conn.execute("SELECT version FROM data_versions WHERE schema = ?", (schema,)).fetchone()[0]
+            snapshots = {}
+            for builder in SNAPSHOT_BUILDERS:
+                snapshots.update(builder(schema, spec["columns"], rows))
+            conn.execute("DELETE FROM replica_snapshots WHERE schema = ?", (schema,))
+            conn.executemany(
+                "INSERT INTO replica_snapshots (schema, name, version, payload) VALUES (?, ?, ?, ?)",
+                [(schema, name, version, payload) for name, payload in snapshots.items()],
+            )
+    except sqlite3.Error as e:
+        print(f"Error writing {schema} replica: {e}")
+        return False
+    _touch_version_stamp()
+    return True
+
+
+def _stamp_signature():
+    try:
+        stat = os.stat(VERSION_STAMP_PATH)
+    except OSError:
+        return None
+    # The stamp is replaced, not rewritten, so the inode changes even within one mtime tick
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+def _touch_version_stamp():
+    # After the commit: a reader that sees the new stamp is guaranteed to read the new versions
+    tmp_path = f"{VERSION_STAMP_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.write(datetime.now(timezone.utc).isoformat())
+        os.replace(tmp_path, VERSION_STAMP_PATH)
+    except OSError as e:
+        print(f"Error writing replica version stamp: {e}")
+    with _version_lock:
+        _version_cache["versions"] = None
+
+
+def get_data_version(schema):
+    """
+    Return the data version token for a schema. Every refresh bumps it by one.
+
+    Served from memory until the version stamp changes (a replica write in this or
+    any other worker process).
+
+    Parameters:
+    schema (str): "GLOBAL" or "JP".
+
+    Returns:
+    int: The current version, or 0 if the schema has never been refreshed.
+    """
+    stamp = _stamp_signature()
+    with _version_lock:
+        if _version_cache["versions"] is not None and _version_cache["stamp"] == stamp:
+            return _version_cache["versions"].get(schema, 0)
+    try:
+        versions = dict(get_replica_connection().execute("SELECT schema, version FROM data_versions").fetchall())
+    except sqlite3.Error as e:
+        print(f"Error reading {schema} data version: {e}")
+        return 0
+    with _version_lock:
+        # Stored under the stamp seen before the read: a write in between changes the stamp again
+        _version_cache["stamp"] = stamp
+        _version_cache["versions"] = versions
+    return versions.get(schema, 0)
+
+
+def replica_ready(schema):
+    """Return True once the refresh pipeline has populated the replica for a schema."""
+    try:
+        row = get_replica_connection().execute(
+            "SELECT 1 FROM replica_meta WHERE schema = ?", (schema,)
+        ).fetchone()
+        return row is not None
+    except sqlite3.Error as e:
+        print(f"Error checking {schema} replica: {e}")
+        return False
+
+
+def read_replica(schema, sql, params=()):
+    """
+    Run a read query against the replica.
+
+    Parameters:
+    schema (str): The schema the query targets, used to check the replica is populated.
+    sql (str): The SELECT statement. Table and column names match the warehouse, and parameters
+        use the connector's %s placeholders so the same statement can be sent to either store.
+    params (tuple): Query parameters.
+
+    Returns:
+    list | None: The result rows, or None if the caller should fall back to Snowflake.
+    """
+    if not replica_ready(schema):
+        return None
+    try:
+        return get_replica_connection().execute(sql.replace("%s", "?"), params).fetchall()
+    except sqlite3.Error as e:
+        print(f"Error reading {schema} replica: {e}")
+        return None
+
+
+def read_snapshot(schema, name):
+    """
+    Return a snapshot computed by the last refresh of a schema.
+
+    Parameters:
+    schema (str): "GLOBAL" or "JP".
+    name (str): The snapshot name, e.g. "clusters:z3".
+
+    Returns:
+    str | None: The JSON payload, or None if the replica has no such snapshot yet.
+    """
+    try:
+        row = get_replica_connection().execute(
+            "SELECT payload FROM replica_snapshots WHERE schema = ? AND name = ?", (schema, name)
+        ).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"Error reading {schema} {name} snapshot: {e}")
+        return None
@@ -0,0 +1,47 @@
+-- One-off migration for tables created before the typed event_ts column existed.
+-- The refresh pipeline recreates both tables with this layout, so this only needs
+-- to be run once against an existing YUUBOT_DB.
+USE DATABASE YUUBOT_DB;
+
+-- GLOBAL: add the typed timestamp, backfill it from the string columns and cluster on it
+USE SCHEMA GLOBAL;
+
+ALTER TABLE all_earthquakes_week ADD COLUMN IF NOT EXISTS event_ts TIMESTAMP_NTZ;
+UPDATE all_earthquakes_week
+   SET event_ts = TRY_TO_TIMESTAMP_NTZ(date || ' ' || time)
+ WHERE event_ts IS NULL;
+ALTER TABLE all_earthquakes_week CLUSTER BY (TO_DATE(event_ts));
+
+-- JP: same as above, and convert magnitude from STRING to FLOAT
+USE SCHEMA JP;
+
+ALTER TABLE all_jp_earthquakes ADD COLUMN IF NOT EXISTS event_ts TIMESTAMP_NTZ;
+UPDATE all_jp_earthquakes
+   SET event_ts = TRY_TO_TIMESTAMP_NTZ(date || ' ' || time)
+ WHERE event_ts IS NULL;
+
+-- Guarded on the column's current type so the script can be re-run, including
+-- after a run that stopped between the DROP and the RENAME
+EXECUTE IMMEDIATE $$
+DECLARE
+  magnitude_type STRING;
+BEGIN
+  SELECT MAX(data_type) INTO :magnitude_type
+    FROM YUUBOT_DB.INFORMATION_SCHEMA.COLUMNS
+   WHERE table_schema = 'JP' AND table_name = 'ALL_JP_EARTHQUAKES' AND column_name = 'MAGNITUDE';
+  IF (magnitude_type = 'TEXT') THEN
+    ALTER TABLE YUUBOT_DB.JP.all_jp_earthquakes ADD COLUMN IF NOT EXISTS magnitude_num FLOAT;
+    UPDATE YUUBOT_DB.JP.all_jp_earthquakes SET magnitude_num = TRY_TO_DOUBLE(magnitude);
+    ALTER TABLE YUUBOT_DB.JP.all_jp_earthquakes DROP COLUMN magnitude;
+    magnitude_type := NULL;
+  END IF;
+  -- Dropped above or by an interrupted run: move the converted column into place.
+  -- When magnitude is already FLOAT the conversion is done and both steps are skipped
+  IF (magnitude_type IS NULL) THEN
+    ALTER TABLE YUUBOT_DB.JP.all_jp_earthquakes RENAME COLUMN magnitude_num TO magnitude;
+  END IF;
+  RETURN 'magnitude is FLOAT';
+END;
+$$;
+
+ALTER TABLE all_jp_earthquakes CLUSTER BY (TO_DATE(event_ts));
@@ -0,0 +1,79 @@
+import json
+import math
+
+# Grid clustering of quake markers. The world is cut into square lat/lon cells
+# whose size halves with every zoom level, roughly CELLS_PER_TILE cells across
+# one 256px map tile, so a cluster covers a similar patch of screen at every
+# zoom. Clusters are built once per refresh for every zoom up to
+# CLUSTER_MAX_ZOOM and stored in the replica; past that the map asks for the
+# individual quakes in its viewport instead.
+CLUSTER_MAX_ZOOM = 5
+CELLS_PER_TILE = 4
+
+
+def cell_size(zoom):
+    """Return the width of a cluster cell in degrees at a zoom level."""
+    return 360.0 / (2 ** zoom * CELLS_PER_TILE)
+
+
+def build_clusters(quakes, zoom):
+    """
+    Aggregate quakes into grid cells.
+
+    Parameters:
+    quakes (list): (lat, lon, magnitude) tuples. Quakes without coordinates are skipped.
+    zoom (int): The map zoom level that decides the cell size.
+
+    Returns:
+    list: One dict per non-empty cell with lat/lon (the centroid of its quakes), count and
+        max_magnitude, largest clusters first.
+    """
+    size = cell_size(zoom)
+    cells = {}
+    for lat, lon, magnitude in quakes:
+        if lat is None or lon is None:
+            continue
+        cell = (math.floor((lon + 180.0) / size), math.floor((lat + 90.0) / size))
+        entry = cells.get(cell)
+        if entry is None:
+            entry = cells[cell] = [0, 0.0, 0.0, None]
+        entry[0] += 1
+        entry[1] += lat
+        entry[2] += lon
+        if magnitude is not None and (entry[3] is None or magnitude > entry[3]):
+            entry[3] = magnitude
+
+    clusters = [
+        {
+            "lat": round(lat_sum / count, 4),
+            "lon": round(lon_sum / count, 4),
+            "count": count,
+            "max_magnitude": max_magnitude,
+        }
+        for count, lat_sum, lon_sum, max_magnitude in cells.values()
+    ]
+    clusters.sort(key=lambda cluster: cluster["count"], reverse=True)
+    return clusters
+
+
+def cluster_snapshots(schema, columns, rows):
+    """
+    Build the serialized clusters for every zoom level from a refresh's rows.
+
+    Parameters:
+    schema (str): "GLOBAL" or "JP".
+    columns (list): Column names of the row tuples.
+    rows (list): The rows written to the replica.
+
+    Returns:
+    dict: Snapshot name ("clusters:z<zoom>") to JSON payload.
+    """
+    lat_i, lon_i, mag_i = columns.index("lat"), columns.index("lon"), columns.index("magnitude")
+    quakes = [
+        (row[lat_i], row[lon_i], float(row[mag_i]) if row[mag_i] is not None else None)
+        for row in rows
+    ]
+    return {
+        f"clusters:z{zoom}": json.dumps(build_clusters(quakes, zoom), separators=(",", ":"))
+        for zoom in range(CLUSTER_MAX_ZOOM + 1)
+    }
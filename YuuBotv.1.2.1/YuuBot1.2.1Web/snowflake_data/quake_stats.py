@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timezone
+
+# Summary statistics computed once per refresh and stored in the replica, so
+# the dashboard counters are a snapshot read instead of one COUNT(*) query per
+# counter. Magnitude bands are [lower, upper) and the last band is open-ended.
+MAGNITUDE_BANDS = [
+    ("<2", None, 2.0),
+    ("2-3", 2.0, 3.0),
+    ("3-4", 3.0, 4.0),
+    ("4-5", 4.0, 5.0),
+    ("5-6", 5.0, 6.0),
+    ("6-7", 6.0, 7.0),
+    ("7+", 7.0, None),
+]
+SIGNIFICANT_MAGNITUDE = 5.0
+
+
+def _magnitude_band(magnitude):
+    if magnitude is None:
+        return "unknown"
+    for name, lower, upper in MAGNITUDE_BANDS:
+        if (lower is None or magnitude >= lower) and (upper is None or magnitude < upper):
+            return name
+    return "unknown"
+
+
+def build_stats(schema, columns, rows):
+    """
+    Summarise a schema's quakes.
+
+    Japan quakes without coordinates are left out, the same as in the dashboard list.
+
+    Parameters:
+    schema (str): "GLOBAL" or "JP".
+    columns (list): Column names of the row tuples.
+    rows (list): The quake rows.
+
+    Returns:
+    dict: count, significant (magnitude >= 5.0), by_magnitude, by_day (event date to count,
+        oldest first), tsunami (None for Japan, which has no tsunami flag), latest (the newest
+        quake) and generated_at.
+    """
+    quakes = [dict(zip(columns, row)) for row in rows]
+    if schema == "JP":
+        quakes = [quake for quake in quakes if quake["lat"] is not None and quake["lon"] is not None]
+
+    by_magnitude = {name: 0 for name, _, _ in MAGNITUDE_BANDS}
+    by_magnitude["unknown"] = 0
+    by_day = {}
+    significant = 0
+    tsunami = 0
+    latest = None
+    for quake in quakes:
+        magnitude = float(quake["magnitude"]) if quake["magnitude"] is not None else None
+        by_magnitude[_magnitude_band(magnitude)] += 1
+        if magnitude is not None and magnitude >= SIGNIFICANT_MAGNITUDE:
+            significant += 1
+        if quake.get("tsunami"):
+            tsunami += 1
+        if quake["event_ts"] is not None:
+            event_ts = str(quake["event_ts"])
+            by_day[event_ts[:10]] = by_day.get(event_ts[:10], 0) + 1
+            if latest is None or event_ts > str(latest["event_ts"]):
+                latest = quake
+
+    if latest is not None:
+        latest = {key: (str(value) if key in ("date", "time", "event_ts") and value is not None else value)
+                  for key, value in latest.items()}
+    return {
+        "count": len(quakes),
+        "significant": significant,
+        "by_magnitude": by_magnitude,
+        "by_day": dict(sorted(by_day.items())),
+        "tsunami": tsunami if "tsunami" in columns else None,
+        "latest": latest,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def stats_snapshots(schema, columns, rows):
+    """Snapshot builder for the replica: returns {"stats": JSON payload}."""
+    return {"stats": json.dumps(build_stats(schema, columns, rows), separators=(",", ":"))}
@@ -1,17 +1,34 @@
 import snowflake.connector
 import requests
 import re
+import json
+import os
 from datetime import datetime
 from snowflake_data.the_main_connector import create_snowflake_connection
+from snowflake_data.local_replica import write_replica
+from snowflake_data.warehouse_metrics import execute_tracked
 from concurrent.futures import ThreadPoolExecutor
 from scrapy.selector import Selector
 from scrapy.http import HtmlResponse
 from bs4 import BeautifulSoup
 
-url = "https://typhoon.yahoo.co.jp/weather/jp/earthquake/list/"
-html = requests.get(url).text
-response = HtmlResponse(url=url, body=html, encoding='utf-8')
-selector = Selector(response).xpath('/html/body/div[@id="wrapper"]/div[@id="contents"]/div[@id="contents-body"]/div[@id="main"]/div[@class="yjw_main_md"]/div[@id="eqhist"]/table/tr/td').getall()[4:]
+JP_QUAKE_LIST_URL = "https://typhoon.yahoo.co.jp/weather/jp/earthquake/list/"
+
+# The chat app (YuuBot1.2.1Chat) keys its answer cache on this file, which its own
+# refresh_data.py also writes. The default is the chat app's copy next to this one;
+# set YUUBOT_DATA_VERSION_FILE to the same path for both when they live elsewhere.
+DATA_VERSION_FILE = os.getenv(
+    "YUUBOT_DATA_VERSION_FILE",
+    os.path.normpath(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "YuuBot1.2.1Chat", "data_version.json"
+    )),
+)
+
+def fetch_jp_quake_list_cells():
+    # Fetched on every refresh (not at import) so scheduled refreshes see new quakes
+    html = requests.get(JP_QUAKE_LIST_URL).text
+    response = HtmlResponse(url=JP_QUAKE_LIST_URL, body=html, encoding='utf-8')
+    return Selector(response).xpath('/html/body/div[@id="wrapper"]/div[@id="contents"]/div[@id="contents-body"]/div[@id="main"]/div[@class="yjw_main_md"]/div[@id="eqhist"]/table/tr/td').getall()[4:]
 
 def convert_timestamp_to_date(timestamp):
     try:
@@ -66,12 +83,13 @@ def get_usgs_earthquakes_from_past_week():
             location = quake.get('properties', {}).get('place', 'N/A')
             date = convert_timestamp_to_date(int(quake.get('properties', {}).get('time', 'N/A'))).split(" ")[0]
             time = convert_timestamp_to_date(int(quake.get('properties', {}).get('time', 'N/A'))).split(" ")[1]
+            event_ts = f"{date} {time}"
             title = quake.get('properties', {}).get('title', 'N/A')
             tsunami = check_tsunami(quake.get('properties', {}).get('tsunami', 'N/A'))
             coordinates = quake.get('geometry', {}).get('coordinates', [None, None])
             lon = coordinates[0] if len(coordinates) > 0 else None
             lat = coordinates[1] if len(coordinates) > 1 else None
-            all_quakes.append((date, time, magnitude, location, title, tsunami, lat, lon))
+            all_quakes.append((date, time, magnitude, location, title, tsunami, lat, lon, event_ts))
 
         return all_quakes
 
@@ -131,8 +149,8 @@ def extract_jp_quake_info(url):
         }
     return {"date": None, "time": None, "magnitude": None, "intensity": "---", "location": None, "latitude": None, "longitude": None}
 
-def process_jp_quake(i):
-    cell = re.sub(r'<td(?:\s+align="center")?>', '', selector[i]).replace('</td>', '').strip()
+def process_jp_quake(cells, i):
+    cell = re.sub(r'<td(?:\s+align="center")?>', '', cells[i]).replace('</td>', '').strip()
     soup = BeautifulSoup(cell, 'html.parser')
     a_tag = soup.find('a')
     link = a_tag['href'] if a_tag and a_tag.has_attr('href') else None
@@ -141,18 +159,19 @@ def process_jp_quake(i):
     return {"date": None, "time": None, "magnitude": None, "intensity": "---", "location": None, "latitude": None, "longitude": None}
 
 def get_jp_quake_info_list():
-    num_quakes = len(selector) // 4
+    cells = fetch_jp_quake_list_cells()
+    num_quakes = len(cells) // 4
     quake_info_list = []
     with ThreadPoolExecutor(max_workers=8) as executor:
-        futures = [executor.submit(process_jp_quake, i*4) for i in range(num_quakes)]
+        futures = [executor.submit(process_jp_quake, cells, i*4) for i in range(num_quakes)]
         for future in futures:
             quake_info_list.append(future.result())
     
     return quake_info_list
 
-def global_or_jp(schema, ins_cur):
+def global_or_jp(schema, ins_cur, tag="pipeline:refresh"):
     if schema == "GLOBAL":
-        ins_cur.execute("""
+        execute_tracked(ins_cur, tag, """
             CREATE OR REPLACE TABLE all_earthquakes_week (
                 date STRING,
                 time STRING,
@@ -161,24 +180,31 @@ def global_or_jp(schema, ins_cur):
                 title STRING,
                 tsunami BOOLEAN,
                 lat FLOAT,
-                lon FLOAT
+                lon FLOAT,
+                event_ts TIMESTAMP_NTZ
             )
+            CLUSTER BY (TO_DATE(event_ts))
         """)
 
         data_to_insert = get_usgs_earthquakes_from_past_week()
-        insert_sql = "INSERT INTO all_earthquakes_week (date, time, magnitude, location, title, tsunami, lat, lon) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
-        ins_cur.executemany(insert_sql, data_to_insert)
+        # Insert newest first so micro-partitions are written in event_ts order
+        data_to_insert.sort(key=lambda row: row[8] or "", reverse=True)
+        insert_sql = "INSERT INTO all_earthquakes_week (date, time, magnitude, location, title, tsunami, lat, lon, event_ts) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        execute_tracked(ins_cur, tag, insert_sql, data_to_insert, many=True)
+        return data_to_insert
     elif schema == "JP":
-        ins_cur.execute("""
+        execute_tracked(ins_cur, tag, """
             CREATE OR REPLACE TABLE all_jp_earthquakes (
                 date STRING,
                 time STRING,
                 epicenter STRING,
-                magnitude STRING,
+                magnitude FLOAT,
                 intensity STRING,
                 lat FLOAT,
-                lon FLOAT
+                lon FLOAT,
+                event_ts TIMESTAMP_NTZ
             )
+            CLUSTER BY (TO_DATE(event_ts))
         """)
     
         data_dicts = get_jp_quake_info_list()
@@ -192,33 +218,77 @@ def global_or_jp(schema, ins_cur):
                 d.get("intensity"),
                 float(d.get("latitude")) if d.get("latitude") not in (None, '') else None,
                 float(d.get("longitude")) if d.get("longitude") not in (None, '') else None,
+                f"{d.get('date')} {d.get('time')}" if d.get("date") and d.get("time") else None,
             ))
-        insert_sql = "INSERT INTO all_jp_earthquakes (date, time, epicenter, magnitude, intensity, lat, lon) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-        ins_cur.executemany(insert_sql, data_to_insert)
+        data_to_insert.sort(key=lambda row: row[7] or "", reverse=True)
+        insert_sql = "INSERT INTO all_jp_earthquakes (date, time, epicenter, magnitude, intensity, lat, lon, event_ts) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+        execute_tracked(ins_cur, tag, insert_sql, data_to_insert, many=True)
+        return data_to_insert
     else:
         print("Invalid schema specified. Use 'GLOBAL' or 'JP'.")
+        return None
+
+def write_data_version(schema):
+    """
+    Record a successful warehouse load of schema in the shared data version file.
+
+    Same format as refresh_data.py: each schema mapped to the time of its last ingest,
+    replaced atomically. Skipped when the file's directory does not exist (no chat app
+    on this host).
+
+    Parameters:
+    schema (str): The schema that was refreshed.
+    """
+    if not os.path.isdir(os.path.dirname(DATA_VERSION_FILE)):
+        return
+    try:
+        with open(DATA_VERSION_FILE, encoding="utf-8") as fh:
+            versions = json.load(fh)
+    except (OSError, ValueError):
+        versions = {}
+    versions[schema] = datetime.now().isoformat(timespec="microseconds")
+    # Per-process temp file: refresh_data.py and other web workers may write at the same time
+    tmp_path = f"{DATA_VERSION_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(versions, fh, sort_keys=True)
+        os.replace(tmp_path, DATA_VERSION_FILE)
+    except OSError as e:
+        print(f"Error writing data version file: {e}")
 
 def insert_overall_data_to_snowflake(schema):
-    the_conn = create_snowflake_connection(schema)
+    tag = f"pipeline:refresh_{schema.lower()}"
+    the_conn = create_snowflake_connection(schema, query_tag=tag)
+    cur = None
+    inserted_count = None
 
     try:
         # 2. Create a cursor object
         cur = the_conn.cursor()
 
         # 3. Insert data based on schema
-        global_or_jp(schema, cur)
+        inserted_rows = global_or_jp(schema, cur, tag)
 
         # 4. Commit the transaction
         the_conn.commit()
+        # The chat agent reads the warehouse tables, so its cached answers expire now
+        write_data_version(schema)
 
         print(f"{cur.rowcount} records inserted successfully.")
+
+        # 5. Mirror the committed rows into the local read replica. The refresh only counts
+        # as done once the replica has them too; otherwise None tells the scheduler to retry
+        if inserted_rows is not None and write_replica(schema, inserted_rows):
+            inserted_count = len(inserted_rows)
     except snowflake.connector.Error as e:
         print(f"Error: {e}")
         # Rollback the transaction if an error occurs
         the_conn.rollback()
     finally:
-        # 5. Close the cursor and connection
+        # 6. Close the cursor and connection
         if cur:
             cur.close()
         if the_conn:
-            the_conn.close()
\ No newline at end of file
+            the_conn.close()
+
+    return inserted_count
\ No newline at end of file
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# In-process cache for read query results. Entries are keyed by the query and
+# the schema's data version, so a completed refresh (which bumps the version)
+# makes every older entry unreachable; the TTL and size bound only exist to
+# keep memory in check between refreshes.
+CACHE_TTL_SECONDS = float(os.getenv("YUUBOT_CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("YUUBOT_CACHE_SIZE", "256"))
+
+
+class QueryCache:
+    def __init__(self, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None on a miss or expired entry.
+
+        Parameters:
+        key (tuple): The cache key, including the data version.
+
+        Returns:
+        object | None: The cached value.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the hit/miss counters and current size as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+query_cache = QueryCache()
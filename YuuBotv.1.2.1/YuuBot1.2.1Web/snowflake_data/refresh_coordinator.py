@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Single-flight coordination for refreshes. Within a process, concurrent
+# callers for the same schema join the in-flight refresh. Across processes
+# (multi-worker WSGI servers), a per-schema lock file serialises refreshes,
+# and a status file next to it lets a caller that waited on the lock see that
+# someone else finished a refresh in the meantime and reuse that result
+# instead of scraping and rebuilding the table again.
+LOCK_DIR = os.getenv("YUUBOT_LOCK_DIR", tempfile.gettempdir())
+# A refresh that finished less than this many seconds ago is shared instead of repeated
+REFRESH_MIN_AGE_SECONDS = float(os.getenv("YUUBOT_REFRESH_MIN_AGE", "60"))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    self._fh.seek(0)
+                    msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 seconds; keep waiting for the holder
+                    continue
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+            else:
+                self._fh.seek(0)
+                msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._fh.close()
+
+
+def _status_path(schema):
+    return os.path.join(LOCK_DIR, f"yuubot_refresh_{schema.lower()}.json")
+
+
+def _read_status(schema):
+    try:
+        with open(_status_path(schema), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_status(schema, status):
+    # Write then rename so readers never see a half-written file
+    tmp_path = _status_path(schema) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(status, fh)
+    os.replace(tmp_path, _status_path(schema))
+
+
+def _refresh_across_processes(schema, refresh_fn, force):
+    waited_since = time.time()
+    with _FileLock(os.path.join(LOCK_DIR, f"yuubot_refresh_{schema.lower()}.lock")):
+        status = _read_status(schema)
+        if status and status.get("ok"):
+            finished_at = status.get("finished_at", 0)
+            # Another worker finished while we waited for the lock, or (unless forced) very recently
+            if finished_at >= waited_since or (not force and time.time() - finished_at < REFRESH_MIN_AGE_SECONDS):
+                return dict(status, shared=True)
+
+        started_at = time.time()
+        rows = refresh_fn(schema)
+        status = {
+            "schema": schema,
+            "ok": rows is not None,
+            "rows": rows,
+            "started_at": started_at,
+            "finished_at": time.time(),
+            "pid": os.getpid(),
+        }
+        _write_status(schema, status)
+        return dict(status, shared=False)
+
+
+def run_refresh(schema, refresh_fn, force=False):
+    """
+    Refresh a schema, or join a refresh of it that is already in flight.
+
+    Parameters:
+    schema (str): "GLOBAL" or "JP".
+    refresh_fn (callable): Does the actual refresh; returns the number of rows written, or None on failure.
+    force (bool): Refresh even if one finished less than REFRESH_MIN_AGE_SECONDS ago. A refresh
+        already in flight is still joined, as its result is newer than the request.
+
+    Returns:
+    dict: The refresh status (ok, rows, started_at, finished_at, pid), with shared=True
+        when the result came from another caller's refresh.
+    """
+    requested_at = time.time()
+    while True:
+        with _flights_lock:
+            flight = _flights.get(schema)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                _flights[schema] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # The flight may have reused an older result; a forced caller then refreshes itself
+            if force and flight.result.get("finished_at", 0) < requested_at:
+                continue
+            return dict(flight.result, shared=True)
+
+        try:
+            flight.result = _refresh_across_processes(schema, refresh_fn, force)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with _flights_lock:
+                del _flights[schema]
+            flight.done.set()
@@ -0,0 +1,94 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+# Background refresh loop. The scrape + warehouse rebuild used to run inside
+# request handlers; it now runs here on a fixed interval with random jitter
+# (so several app instances do not hit Yahoo/USGS in lockstep), and the
+# routes only read the replica.
+REFRESH_INTERVAL_SECONDS = float(os.getenv("YUUBOT_REFRESH_INTERVAL", "300"))
+REFRESH_JITTER_SECONDS = float(os.getenv("YUUBOT_REFRESH_JITTER", "30"))
+# After a run in which any schema failed, the next run comes this soon instead
+REFRESH_RETRY_SECONDS = float(os.getenv("YUUBOT_REFRESH_RETRY", "60"))
+
+
+class RefreshScheduler:
+    def __init__(self, refresh_fn, schemas=("JP", "GLOBAL"),
+                 interval_seconds=REFRESH_INTERVAL_SECONDS, jitter_seconds=REFRESH_JITTER_SECONDS,
+                 retry_seconds=REFRESH_RETRY_SECONDS):
+        """
+        Parameters:
+        refresh_fn (callable): Called with each schema name to refresh it. Returns the refresh
+            status dict from run_refresh; a status with ok=False (or an exception) is a failure.
+        schemas (tuple): The schemas to refresh on every run.
+        interval_seconds (float): Base delay between the end of one run and the start of the next.
+        jitter_seconds (float): Up to this many seconds are added to each delay at random.
+        retry_seconds (float): Base delay after a run in which any schema failed.
+        """
+        self.refresh_fn = refresh_fn
+        self.schemas = schemas
+        self.interval_seconds = interval_seconds
+        self.jitter_seconds = jitter_seconds
+        self.retry_seconds = retry_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_run = {}
+
+    def start(self):
+        """Start the background thread. Calling it again while running does nothing."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="yuubot-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask the loop to exit and wait for the current run to finish."""
+        self._stop.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def run_once(self):
+        """
+        Refresh every schema once.
+
+        Returns:
+        bool: True if every schema refreshed successfully.
+        """
+        all_ok = True
+        for schema in self.schemas:
+            if self._stop.is_set():
+                return all_ok
+            start = time.perf_counter()
+            status = {"started_at": datetime.now(timezone.utc).isoformat()}
+            try:
+                result = self.refresh_fn(schema)
+                # The pipeline reports warehouse and replica errors in the result instead of raising
+                status["ok"] = bool(result and result.get("ok"))
+                if not status["ok"]:
+                    status["error"] = "refresh did not complete; see the log"
+            except Exception as e:
+                # Keep the loop alive through scrape/network failures; the next run retries
+                print(f"Error refreshing {schema} earthquakes: {e}")
+                status["ok"] = False
+                status["error"] = str(e)
+            status["elapsed_s"] = round(time.perf_counter() - start, 2)
+            self.last_run[schema] = status
+            all_ok = all_ok and status["ok"]
+        return all_ok
+
+    def _next_delay(self, ok=True):
+        base = self.interval_seconds if ok else min(self.retry_seconds, self.interval_seconds)
+        return base + random.uniform(0, self.jitter_seconds)
+
+    def _run(self):
+        # Refresh immediately so a fresh process has data, then settle into the interval
+        while not self._stop.is_set():
+            ok = self.run_once()
+            self._stop.wait(self._next_delay(ok))
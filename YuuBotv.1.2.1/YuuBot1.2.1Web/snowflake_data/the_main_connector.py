@@ -1,11 +1,13 @@
 import snowflake.connector
 
-def create_snowflake_connection(schema):
+def create_snowflake_connection(schema, query_tag=None):
     """
     Create and return a Snowflake connection object.
 
     Parameters:
     schema (str): The schema to connect to.
+    query_tag (str): Optional QUERY_TAG for every statement on this connection,
+        naming the route or pipeline stage that issued it.
 
     Returns:
     snowflake.connector.connection.SnowflakeConnection: A Snowflake connection object.
@@ -19,7 +21,8 @@ def create_snowflake_connection(schema):
             account="[INSERT ACCOUNT HERE]",
             warehouse="EARTHQUAKE_WH_XS",
             database="YUUBOT_DB",
-            schema=schema
+            schema=schema,
+            session_parameters={"QUERY_TAG": query_tag} if query_tag else None
         )
         
         return conn
@@ -0,0 +1,107 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+# Per-tag warehouse query accounting. Every statement sent through
+# execute_tracked() is timed, logged as one JSON line and folded into the
+# in-process totals that the /metrics route exposes. The same tag is set as
+# the session QUERY_TAG, so the numbers here can be joined against
+# SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY by query id or tag to get credit usage.
+logger = logging.getLogger("yuubot.warehouse")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_lock = threading.Lock()
+_totals = {}
+
+
+def record_query(tag, elapsed_ms, rows, query_id=None, error=None):
+    """
+    Record one warehouse statement against its tag and emit a structured log line.
+
+    Parameters:
+    tag (str): The calling route or pipeline stage, e.g. "web:index" or "pipeline:refresh_jp".
+    elapsed_ms (float): Wall-clock time of the statement in milliseconds.
+    rows (int | None): Rows returned or affected.
+    query_id (str | None): The Snowflake query id (cursor.sfqid).
+    error (str | None): The error message if the statement failed.
+    """
+    with _lock:
+        totals = _totals.setdefault(tag, {
+            "queries": 0,
+            "errors": 0,
+            "rows": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "last_query_id": None,
+        })
+        totals["queries"] += 1
+        totals["rows"] += rows or 0
+        totals["total_ms"] += elapsed_ms
+        totals["max_ms"] = max(totals["max_ms"], elapsed_ms)
+        if error:
+            totals["errors"] += 1
+        if query_id:
+            totals["last_query_id"] = query_id
+
+    logger.info(json.dumps({
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "event": "warehouse_query",
+        "tag": tag,
+        "query_id": query_id,
+        "elapsed_ms": round(elapsed_ms, 2),
+        "rows": rows,
+        "error": error,
+    }))
+
+
+def execute_tracked(cur, tag, sql, params=None, many=False, **kwargs):
+    """
+    Execute a statement on a Snowflake cursor and record its latency, row count and query id.
+
+    Parameters:
+    cur (snowflake.connector.cursor.SnowflakeCursor): The cursor to execute on.
+    tag (str): The calling route or pipeline stage.
+    sql (str): The statement.
+    params (tuple | list | None): Bind parameters, or a list of row tuples when many=True.
+    many (bool): Use executemany() instead of execute().
+
+    Returns:
+    snowflake.connector.cursor.SnowflakeCursor: The cursor, as returned by execute().
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        if many:
+            return cur.executemany(sql, params)
+        return cur.execute(sql, params, **kwargs)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        record_query(
+            tag,
+            (time.perf_counter() - start) * 1000,
+            cur.rowcount if error is None else None,
+            getattr(cur, "sfqid", None),
+            error,
+        )
+
+
+def metrics_snapshot():
+    """Return the per-tag totals with average latency, for the /metrics route."""
+    with _lock:
+        snapshot = {}
+        for tag, totals in _totals.items():
+            entry = dict(totals)
+            entry["avg_ms"] = round(totals["total_ms"] / totals["queries"], 2) if totals["queries"] else 0.0
+            entry["total_ms"] = round(totals["total_ms"], 2)
+            entry["max_ms"] = round(totals["max_ms"], 2)
+            snapshot[tag] = entry
+        return snapshot
@@ -0,0 +1,51 @@
+import sqlite3
+
+from snowflake_data.coordinate_query import build_coordinate_query, encode_cursor
+
+COLUMNS = ["magnitude"]
+
+
+def _replica():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE quakes (magnitude REAL, lat REAL, lon REAL, event_ts TEXT)")
+    conn.executemany(
+        "INSERT INTO quakes (magnitude, lat, lon, event_ts) VALUES (?, ?, ?, ?)",
+        [
+            (1.0, 10.0, 20.0, "2026-01-03 00:00:00"),
+            (2.0, 11.0, 21.0, "2026-01-02 00:00:00"),
+            # Rows missing a key column, sorting in the middle of the list and at the end
+            (9.0, None, 21.0, "2026-01-02 00:00:00"),
+            (9.1, 11.0, None, "2026-01-02 00:00:00"),
+            (9.2, 12.0, 22.0, None),
+            (3.0, 12.0, 22.0, "2026-01-01 00:00:00"),
+        ],
+    )
+    return conn
+
+
+def _pages(conn, limit):
+    # Page through the table the way query_coordinates does
+    pages, cursor = [], None
+    while True:
+        args = {"limit": str(limit)}
+        if cursor:
+            args["cursor"] = cursor
+        sql, params, limit = build_coordinate_query("quakes", COLUMNS, args)
+        rows = conn.execute(sql.replace("%s", "?"), params).fetchall()
+        pages.append([row[0] for row in rows])
+        if len(rows) < limit:
+            return pages
+        cursor = encode_cursor(*rows[-1][-3:])
+
+
+def test_null_keys_are_skipped_across_page_boundaries():
+    conn = _replica()
+    for limit in (1, 2, 3):
+        pages = _pages(conn, limit)
+        assert [magnitude for page in pages for magnitude in page] == [1.0, 2.0, 3.0]
+
+
+def test_unpaged_query_skips_null_keys_too():
+    conn = _replica()
+    sql, params, _ = build_coordinate_query("quakes", COLUMNS, {})
+    assert [row[0] for row in conn.execute(sql.replace("%s", "?"), params)] == [1.0, 2.0, 3.0]
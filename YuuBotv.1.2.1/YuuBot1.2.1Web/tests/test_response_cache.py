@@ -0,0 +1,43 @@
+from flask import Flask, jsonify, request
+
+from response_cache import encoded_cache, init_response_cache
+
+
+def _app():
+    app = Flask(__name__)
+    calls = []
+
+    @app.route("/coordinates")
+    def coordinates():
+        calls.append(request.args.get("cursor"))
+        response = jsonify([{"lat": 35.0, "lon": 139.0}] * 100)
+        response.headers["X-Next-Cursor"] = "next-" + (request.args.get("cursor") or "start")
+        return response
+
+    init_response_cache(app, lambda: (1, 1))
+    return app, calls
+
+
+def test_cached_replay_keeps_view_headers():
+    encoded_cache.clear()
+    app, calls = _app()
+    client = app.test_client()
+    for encoding in ("identity", "gzip"):
+        first = client.get("/coordinates?limit=2&cursor=abc", headers={"Accept-Encoding": encoding})
+        second = client.get("/coordinates?limit=2&cursor=abc", headers={"Accept-Encoding": encoding})
+        assert second.status_code == 200
+        assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"] == "next-abc"
+        assert second.headers["ETag"] == first.headers["ETag"]
+        assert second.get_data() == first.get_data()
+    # The second request of each pair was served from the cache
+    assert len(calls) == 2
+
+
+def test_cached_replay_does_not_duplicate_derived_headers():
+    encoded_cache.clear()
+    app, _ = _app()
+    client = app.test_client()
+    client.get("/coordinates", headers={"Accept-Encoding": "gzip"})
+    replay = client.get("/coordinates", headers={"Accept-Encoding": "gzip"})
+    assert replay.headers.getlist("Content-Encoding") == ["gzip"]
+    assert replay.headers.getlist("Vary") == ["Accept-Encoding"]
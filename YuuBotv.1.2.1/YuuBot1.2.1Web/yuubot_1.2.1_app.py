@@ -1,241 +1,571 @@
-from flask import Flask, render_template, jsonify
+import json
+import os
+import time
+from flask import Flask, Response, render_template, jsonify, request, has_request_context, stream_with_context
 from snowflake_data.the_main_connector import create_snowflake_connection
 from snowflake_data.quakes_overall_conn import insert_overall_data_to_snowflake
+from snowflake_data.local_replica import read_replica, read_snapshot, get_data_version, get_replica_connection, REPLICA_TABLES
+from snowflake_data.change_feed import ChangeFeedPoller, change_id_bounds, parse_subscription, quake_key, read_delta, sse_stream
+from snowflake_data.query_cache import query_cache
+from snowflake_data.coordinate_query import build_coordinate_query, encode_cursor
+from snowflake_data.columnar import columns_to_records, fetch_columns, rows_to_columns
+from snowflake_data.quake_clusters import CLUSTER_MAX_ZOOM, build_clusters
+from snowflake_data.quake_stats import build_stats
+from snowflake_data.warehouse_metrics import execute_tracked, metrics_snapshot
+from snowflake_data.refresh_scheduler import RefreshScheduler
+from snowflake_data.refresh_coordinator import run_refresh
+from response_cache import init_response_cache
 import snowflake.connector
 
-def refresh_jp_quakes():
-    insert_overall_data_to_snowflake("JP")
+def refresh_quakes(schema, force=False):
+    # Single-flight across threads and worker processes: concurrent callers share one refresh
+    return run_refresh(schema, insert_overall_data_to_snowflake, force=force)
 
-def refresh_global_quakes():
-    insert_overall_data_to_snowflake("GLOBAL")
+# Refreshes run in the background; request handlers below only read
+refresh_scheduler = RefreshScheduler(refresh_quakes)
 
-def get_global_quakes():
-    refresh_global_quakes()
-    conn = create_snowflake_connection("GLOBAL")
+def current_query_tag():
+    # Tag warehouse statements with the Flask endpoint that issued them
+    if has_request_context() and request.endpoint:
+        return f"web:{request.endpoint}"
+    return "web:background"
+
+def query_warehouse(schema, sql, error_label, params=None, width=None):
+    # With width set, the result is fetched as that many column lists (Arrow batches when available)
+    tag = current_query_tag()
+    conn = create_snowflake_connection(schema, query_tag=tag)
+    cur = None
     try:
         cur = conn.cursor()
-        cur.execute("SELECT date, time, magnitude, location, title, tsunami FROM all_earthquakes_week ORDER BY date DESC, time DESC")
-        rows = cur.fetchall()
-        return rows
+        execute_tracked(cur, tag, sql, params)
+        if width is not None:
+            return fetch_columns(cur, width)
+        return cur.fetchall()
     except snowflake.connector.Error as e:
-        print(f"Error fetching global earthquakes: {e}")
-        return []
+        print(f"Error {error_label}: {e}")
+        return None
     finally:
         if cur:
             cur.close()
         if conn:
             conn.close()
 
-def get_jp_quakes():
-    refresh_jp_quakes()
-    conn = create_snowflake_connection("JP")
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT date, time, epicenter, magnitude, intensity FROM all_jp_earthquakes WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY date DESC, time DESC")
-        rows = cur.fetchall()
+def read_quakes(schema, sql, error_label, params=()):
+    """
+    Run a read query against the replica, or Snowflake until the replica is populated.
+
+    Returns:
+    list | None: The result rows, or None if the read failed. Failures are not cached.
+    """
+    # Results only change when a refresh bumps the data version, so key the cache on it
+    cache_key = (schema, sql, tuple(params), get_data_version(schema))
+    rows = query_cache.get(cache_key)
+    if rows is not None:
         return rows
-    except snowflake.connector.Error as e:
-        print(f"Error fetching Japan earthquakes: {e}")
-        return []
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+
+    # Serve reads from the local replica; Snowflake is only hit until the first refresh lands
+    rows = read_replica(schema, sql, tuple(params))
+    if rows is None:
+        rows = query_warehouse(schema, sql, error_label, tuple(params) or None)
+    if rows is not None:
+        query_cache.put(cache_key, rows)
+    return rows
+
+def query_quakes(schema, sql, error_label, params=()):
+    # Like read_quakes, but a failed read shows up as an empty list
+    rows = read_quakes(schema, sql, error_label, params)
+    return rows if rows is not None else []
+
+def query_quake_columns(schema, sql, error_label, params, width):
+    """
+    Like query_quakes, but return the result as column lists.
+
+    Parameters:
+    width (int): The number of columns the query selects.
+
+    Returns:
+    list: One list per column.
+    """
+    cache_key = ("COLUMNS", schema, sql, tuple(params), get_data_version(schema))
+    columns = query_cache.get(cache_key)
+    if columns is not None:
+        return columns
+
+    rows = read_replica(schema, sql, tuple(params))
+    if rows is not None:
+        columns = rows_to_columns(rows, width)
+    else:
+        columns = query_warehouse(schema, sql, error_label, tuple(params) or None, width=width)
+    if columns is None:
+        return [[] for _ in range(width)]
+    query_cache.put(cache_key, columns)
+    return columns
+
+def get_global_quakes():
+    return query_quakes(
+        "GLOBAL",
+        "SELECT date, time, magnitude, location, title, tsunami FROM all_earthquakes_week ORDER BY event_ts DESC",
+        "fetching global earthquakes",
+    )
+
+def get_jp_quakes():
+    return query_quakes(
+        "JP",
+        "SELECT date, time, epicenter, magnitude, intensity FROM all_jp_earthquakes WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY event_ts DESC",
+        "fetching Japan earthquakes",
+    )
 
 def get_most_recent_earthquake_jp():
-    conn = create_snowflake_connection("JP")
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT date, time, epicenter, magnitude, intensity FROM all_jp_earthquakes WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY date DESC LIMIT 1")
-        rows = cur.fetchall()
-        print(rows)
-        return rows
-    except snowflake.connector.Error as e:
-        print(f"Error fetching Japan earthquakes: {e}")
-        return []
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    return query_quakes(
+        "JP",
+        "SELECT date, time, epicenter, magnitude, intensity FROM all_jp_earthquakes WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY event_ts DESC LIMIT 1",
+        "fetching Japan earthquakes",
+    )
 
 def get_most_recent_earthquake_global():
-    conn = create_snowflake_connection("GLOBAL")
+    return query_quakes(
+        "GLOBAL",
+        "SELECT date, time, magnitude, location, tsunami FROM all_earthquakes_week ORDER BY event_ts DESC LIMIT 1",
+        "fetching global earthquakes",
+    )
+
+DASHBOARD_QUERIES = {
+    "JP": "SELECT date, time, epicenter, magnitude, intensity FROM all_jp_earthquakes WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY event_ts DESC",
+    "GLOBAL": "SELECT date, time, magnitude, location, title, tsunami FROM all_earthquakes_week ORDER BY event_ts DESC",
+}
+
+def query_dashboard_warehouse():
+    # One connection, one multi-statement request: JP list first, then the global list
+    tag = current_query_tag()
+    conn = create_snowflake_connection("GLOBAL", query_tag=tag)
+    cur = None
     try:
         cur = conn.cursor()
-        cur.execute("SELECT date, time, magnitude, location, tsunami FROM all_earthquakes_week ORDER BY date DESC, time DESC LIMIT 1")
-        rows = cur.fetchall()
-        return rows
+        execute_tracked(
+            cur,
+            tag,
+            DASHBOARD_QUERIES["JP"].replace("FROM all_jp_earthquakes", "FROM JP.all_jp_earthquakes")
+            + "; "
+            + DASHBOARD_QUERIES["GLOBAL"].replace("FROM all_earthquakes_week", "FROM GLOBAL.all_earthquakes_week"),
+            num_statements=2,
+        )
+        jp_rows = cur.fetchall()
+        cur.nextset()
+        global_rows = cur.fetchall()
+        return jp_rows, global_rows
     except snowflake.connector.Error as e:
-        print(f"Error fetching global earthquakes: {e}")
-        return []
+        print(f"Error fetching dashboard data: {e}")
+        return None
     finally:
         if cur:
             cur.close()
         if conn:
             conn.close()
 
+def get_dashboard_data():
+    """
+    Fetch everything the index page needs in a single round trip.
+
+    The most recent quakes and the counts are derived from the two lists instead of
+    being queried separately.
+
+    Returns:
+    dict: jp_quakes, global_quakes, recent_jp, recent_global and counts.
+    """
+    cache_key = ("DASHBOARD", get_data_version("JP"), get_data_version("GLOBAL"))
+    data = query_cache.get(cache_key)
+    if data is not None:
+        return data
+
+    jp_rows = read_replica("JP", DASHBOARD_QUERIES["JP"])
+    global_rows = read_replica("GLOBAL", DASHBOARD_QUERIES["GLOBAL"])
+    if jp_rows is None or global_rows is None:
+        result = query_dashboard_warehouse()
+        if result is None:
+            return {
+                "jp_quakes": [],
+                "global_quakes": [],
+                "recent_jp": [],
+                "recent_global": [],
+                "counts": {"jp": 0, "global": 0, "significant_jp": 0, "significant_global": 0},
+            }
+        jp_rows, global_rows = result
+
+    data = {
+        "jp_quakes": jp_rows,
+        "global_quakes": global_rows,
+        "recent_jp": jp_rows[:1],
+        # The global spotlight shows (date, time, magnitude, location, tsunami)
+        "recent_global": [(row[0], row[1], row[2], row[3], row[5]) for row in global_rows[:1]],
+        "counts": {
+            "jp": len(jp_rows),
+            "global": len(global_rows),
+            "significant_jp": sum(1 for row in jp_rows if row[3] is not None and float(row[3]) >= 5.0),
+            "significant_global": sum(1 for row in global_rows if row[2] is not None and row[2] >= 5.0),
+        },
+    }
+    query_cache.put(cache_key, data)
+    return data
+
 app = Flask(__name__)
+# Read routes answer If-None-Match from the data versions and cache their compressed bodies;
+# the event stream and the live metrics are never cached
+init_response_cache(
+    app,
+    lambda: (get_data_version("JP"), get_data_version("GLOBAL")),
+    excluded_paths=("/events", "/metrics"),
+    source_paths=(os.path.abspath(__file__), os.path.join(app.root_path, "templates")),
+)
 @app.route('/')
 
 def index():
-    jp_quakes = get_jp_quakes()
-    global_quakes = get_global_quakes()
-    recent_quakes = {
-        "jp": get_most_recent_earthquake_jp(),
-        "global": get_most_recent_earthquake_global()
-    }
+    data = get_dashboard_data()
+
+    return render_template('index.html', jp_quakes=data["jp_quakes"], global_quakes=data["global_quakes"], recent_quakes_jp=data["recent_jp"], recent_quakes_global=data["recent_global"], counts=data["counts"])
+
+@app.route('/dashboard_data')
+def dashboard_data():
+    return jsonify(get_dashboard_data())
+
+# Columns of the table rows the refresh endpoints send, in display order
+QUAKE_LIST_COLUMNS = {
+    "JP": ["date", "time", "epicenter", "magnitude", "intensity"],
+    "GLOBAL": ["date", "time", "magnitude", "location", "title", "tsunami"],
+}
+
+# The list queries plus the identity columns, so every row can be sent with its change-feed key
+QUAKE_LIST_KEYED_QUERIES = {
+    "JP": "SELECT date, time, epicenter, magnitude, intensity, event_ts, lat, lon FROM all_jp_earthquakes "
+          "WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY event_ts DESC",
+    "GLOBAL": "SELECT date, time, magnitude, location, title, tsunami, event_ts, lat, lon FROM all_earthquakes_week "
+              "ORDER BY event_ts DESC",
+}
+
+def quake_list_delta(schema, since):
+    """
+    Build the response for a client that already holds a copy of a schema's quake list.
+
+    Parameters:
+    schema (str): "GLOBAL" or "JP".
+    since (int): The version (change-feed id) the client's copy is current to.
 
-    return render_template('index.html', jp_quakes=jp_quakes, global_quakes=global_quakes, recent_quakes_jp=recent_quakes["jp"], recent_quakes_global=recent_quakes["global"])
+    Returns:
+    dict: mode "delta" with upserts ({key, row}) and removed keys, or mode "full" with every
+        row and its key when the client has to resync. Both carry the new version to send next time.
+    """
+    columns = QUAKE_LIST_COLUMNS[schema]
+    # Read the cursor before the rows: anything that lands in between is re-sent next time, never lost
+    changes, version = read_delta(get_replica_connection(), since, schema)
+
+    if changes is None:
+        rows = query_quakes(schema, QUAKE_LIST_KEYED_QUERIES[schema], f"fetching {schema} earthquakes")
+        width = len(columns)
+        return {
+            "mode": "full",
+            "version": version,
+            "columns": columns,
+            "rows": [list(row[:width]) for row in rows],
+            "keys": [quake_key({"event_ts": row[width], "lat": row[width + 1], "lon": row[width + 2]}) for row in rows],
+        }
+
+    # Changes are in id order, so the last one per key is the row's current state
+    latest = {}
+    for change in changes:
+        latest[change["key"]] = change["quake"] if change["change"] != "removed" else None
+    upserts = []
+    removed = []
+    for key, quake in latest.items():
+        # The JP list only shows quakes with coordinates
+        if quake is None or (schema == "JP" and (quake["lat"] is None or quake["lon"] is None)):
+            removed.append(key)
+        else:
+            upserts.append({"key": key, "row": [quake[column] for column in columns]})
+    return {"mode": "delta", "version": version, "columns": columns, "upserts": upserts, "removed": removed}
+
+def parse_since():
+    try:
+        return int(request.args["since"]) if "since" in request.args else None
+    except ValueError:
+        return 0
 
 @app.route('/refresh_global')
 def refresh_global():
-    refresh_global_quakes()
+    # Returns the latest data written by the background refresh; ?force=1 refreshes first, even
+    # if one just finished, joining any refresh that is already running instead of starting another.
+    # ?since=<version> returns only what changed after that version.
+    if request.args.get("force") == "1":
+        refresh_quakes("GLOBAL", force=True)
+    since = parse_since()
+    if since is not None:
+        return jsonify(quake_list_delta("GLOBAL", since))
+    version = change_id_bounds(get_replica_connection())[1]
     recent = get_most_recent_earthquake_global()
     return jsonify({
         "global_quakes": get_global_quakes(),
-        "recent_global": recent
+        "recent_global": recent,
+        "version": version,
     })
 
 @app.route('/refresh_jp')
 def refresh_jp():
-    refresh_jp_quakes()
+    # Returns the latest data written by the background refresh; ?force=1 refreshes first, even
+    # if one just finished, joining any refresh that is already running instead of starting another.
+    # ?since=<version> returns only what changed after that version.
+    if request.args.get("force") == "1":
+        refresh_quakes("JP", force=True)
+    since = parse_since()
+    if since is not None:
+        return jsonify(quake_list_delta("JP", since))
+    version = change_id_bounds(get_replica_connection())[1]
     recent = get_most_recent_earthquake_jp()
     return jsonify({
         "jp_quakes": get_jp_quakes(),
-        "recent_jp": recent
+        "recent_jp": recent,
+        "version": version,
     })
 
+def query_coordinates(schema, table, columns, error_label, base_filters=()):
+    """
+    Run a coordinate query with the request's bbox/min_mag/start/end/limit/cursor filters.
+
+    Returns:
+    tuple: (one list per requested column, next page cursor or None).
+
+    Raises:
+    ValueError: If the request arguments are malformed.
+    """
+    sql, params, limit = build_coordinate_query(table, columns, request.args, base_filters)
+    # The query also selects event_ts, lat and lon for the cursor
+    result = query_quake_columns(schema, sql, error_label, params, len(columns) + 3)
+    next_cursor = None
+    if limit is not None and len(result[0]) == limit:
+        next_cursor = encode_cursor(result[-3][-1], result[-2][-1], result[-1][-1])
+    return result[:len(columns)], next_cursor
+
+def coordinates_response(names, columns, next_cursor):
+    # ?format=columns sends {name: [values]}; otherwise the body stays a plain array of records
+    # for existing clients. The next page is linked from a header either way.
+    if request.args.get("format") == "columns":
+        response = jsonify(dict(zip(names, columns)))
+    else:
+        response = jsonify(columns_to_records(names, columns))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+JP_COORDINATE_COLUMNS = ["lat", "lon", "date", "time", "intensity", "epicenter", "magnitude"]
+GLOBAL_COORDINATE_COLUMNS = ["lat", "lon", "date", "time", "magnitude", "location", "title", "tsunami"]
+
 @app.route('/jp_coordinates')
 def get_jp_coordinates():
-    conn = create_snowflake_connection("JP")
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT lat, lon, date, time, intensity, epicenter, magnitude "
-            "FROM all_jp_earthquakes WHERE lat IS NOT NULL AND lon IS NOT NULL ORDER BY date DESC, time DESC"
+        columns, next_cursor = query_coordinates(
+            "JP",
+            "all_jp_earthquakes",
+            JP_COORDINATE_COLUMNS,
+            "fetching JP coordinates",
         )
-        rows = cur.fetchall()
-        coordinates = []
-        for row in rows:
-            coordinates.append({
-                "lat": row[0],
-                "lon": row[1],
-                "date": str(row[2]) if row[2] is not None else None,
-                "time": str(row[3]) if row[3] is not None else None,
-                "intensity": row[4],
-                "epicenter": row[5],
-                "magnitude": float(row[6]) if row[6] is not None else None
-            })
-        return jsonify(coordinates)
-    except snowflake.connector.Error as e:
-        print(f"Error fetching JP coordinates: {e}")
-        return jsonify([])
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return coordinates_response(JP_COORDINATE_COLUMNS, columns, next_cursor)
 
 @app.route('/global_coordinates')
 def get_global_coordinates():
-    conn = create_snowflake_connection("GLOBAL")
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT lat, lon, date, time, magnitude, location, title, tsunami FROM all_earthquakes_week ORDER BY date DESC, time DESC"
+        columns, next_cursor = query_coordinates(
+            "GLOBAL",
+            "all_earthquakes_week",
+            GLOBAL_COORDINATE_COLUMNS,
+            "fetching Global coordinates",
         )
-        rows = cur.fetchall()
-        coordinates = []
-        for row in rows:
-            coordinates.append({
-                "lat": row[0],
-                "lon": row[1],
-                "date": str(row[2]) if row[2] is not None else None,
-                "time": str(row[3]) if row[3] is not None else None,
-                "magnitude": float(row[4]) if row[4] is not None else None,
-                "location": row[5],
-                "title": row[6],
-                "tsunami": bool(row[7]) if row[7] is not None else None
-            })
-        return jsonify(coordinates)
-    except snowflake.connector.Error as e:
-        print(f"Error fetching Global coordinates: {e}")
-        return jsonify([])
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return coordinates_response(GLOBAL_COORDINATE_COLUMNS, columns, next_cursor)
+
+def unavailable():
+    # The data could not be read yet (no replica and the warehouse failed); clients should retry
+    response = jsonify({"error": "earthquake data is temporarily unavailable"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "30"
+    return response
+
+def get_clusters(schema, zoom):
+    """
+    Return the serialized marker clusters of a schema at a zoom level.
+
+    Served straight from the snapshot the last refresh stored in the replica; until the replica
+    is populated they are computed from the warehouse rows and cached per data version.
+
+    Returns:
+    str | None: A JSON array of clusters, or None if the warehouse read failed.
+    """
+    payload = read_snapshot(schema, f"clusters:z{zoom}")
+    if payload is not None:
+        return payload
+
+    cache_key = ("CLUSTERS", schema, zoom, get_data_version(schema))
+    payload = query_cache.get(cache_key)
+    if payload is None:
+        rows = read_quakes(
+            schema,
+            f"SELECT lat, lon, magnitude FROM {REPLICA_TABLES[schema]['table']} WHERE lat IS NOT NULL AND lon IS NOT NULL",
+            f"fetching {schema} clusters",
+        )
+        if rows is None:
+            # Not cached: an empty map would otherwise stick until the next refresh
+            return None
+        quakes = [(row[0], row[1], float(row[2]) if row[2] is not None else None) for row in rows]
+        payload = json.dumps(build_clusters(quakes, zoom), separators=(",", ":"))
+        query_cache.put(cache_key, payload)
+    return payload
+
+@app.route('/clusters')
+def clusters():
+    # ?schema=GLOBAL|JP&zoom=<map zoom>; zooms past CLUSTER_MAX_ZOOM get the finest clusters
+    schema = request.args.get("schema", "GLOBAL").upper()
+    if schema not in REPLICA_TABLES:
+        return jsonify({"error": "schema must be GLOBAL or JP"}), 400
+    try:
+        zoom = int(request.args.get("zoom", "0"))
+    except ValueError:
+        return jsonify({"error": "zoom must be an integer"}), 400
+    zoom = max(0, min(zoom, CLUSTER_MAX_ZOOM))
+    payload = get_clusters(schema, zoom)
+    if payload is None:
+        return unavailable()
+    response = Response(payload, mimetype="application/json")
+    response.headers["X-Cluster-Max-Zoom"] = str(CLUSTER_MAX_ZOOM)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        "warehouse": metrics_snapshot(),
+        "query_cache": query_cache.stats(),
+        "refresh": refresh_scheduler.last_run,
+    })
+
+SSE_POLL_SECONDS = float(os.getenv("YUUBOT_SSE_POLL", "2"))
+# One change-log poll per process, shared by every /events subscriber
+change_poller = ChangeFeedPoller(get_replica_connection, SSE_POLL_SECONDS)
+
+@app.route('/events')
+def events():
+    schema, last_id = parse_subscription(
+        request.args.get("schema"),
+        request.headers.get("Last-Event-ID") or request.args.get("last_event_id"),
+    )
+
+    def stream():
+        # sse_stream is shared with asgi.py; here a None step just sleeps this thread
+        for chunk in sse_stream(change_poller, schema, last_id):
+            if chunk is None:
+                time.sleep(SSE_POLL_SECONDS)
+            else:
+                yield chunk
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def get_stats_payload(schema):
+    """
+    Return the stats snapshot of a schema as JSON text.
+
+    Read from the snapshot the last refresh stored in the replica; until the replica is
+    populated it is computed from the warehouse rows and cached per data version.
+
+    Returns:
+    str | None: The stats JSON, or None if the warehouse read failed.
+    """
+    payload = read_snapshot(schema, "stats")
+    if payload is not None:
+        return payload
+
+    cache_key = ("STATS", schema, get_data_version(schema))
+    payload = query_cache.get(cache_key)
+    if payload is None:
+        spec = REPLICA_TABLES[schema]
+        rows = read_quakes(
+            schema,
+            f"SELECT {', '.join(spec['columns'])} FROM {spec['table']}",
+            f"computing {schema} stats",
+        )
+        if rows is None:
+            # Not cached: zero counts would otherwise stick until the next refresh
+            return None
+        payload = json.dumps(build_stats(schema, spec["columns"], rows), separators=(",", ":"), default=str)
+        query_cache.put(cache_key, payload)
+    return payload
+
+def get_stats(schema):
+    # Parsed once per data version for the count aliases
+    cache_key = ("STATS_PARSED", schema, get_data_version(schema))
+    stats = query_cache.get(cache_key)
+    if stats is None:
+        payload = get_stats_payload(schema)
+        if payload is None:
+            return None
+        stats = json.loads(payload)
+        query_cache.put(cache_key, stats)
+    return stats
+
+def stats_count(schema, field):
+    stats = get_stats(schema)
+    if stats is None:
+        return unavailable()
+    return jsonify({"count": stats[field]})
+
+@app.route('/stats')
+def stats():
+    # Counts by magnitude band, per-day histogram, tsunami count and latest quake, per schema
+    schema = request.args.get("schema", "").upper()
+    if schema:
+        if schema not in REPLICA_TABLES:
+            return jsonify({"error": "schema must be GLOBAL or JP"}), 400
+        payload = get_stats_payload(schema)
+        if payload is None:
+            return unavailable()
+        return Response(payload, mimetype="application/json")
+    jp, world = get_stats_payload("JP"), get_stats_payload("GLOBAL")
+    if jp is None or world is None:
+        return unavailable()
+    # The snapshots are already JSON; splice them together instead of re-encoding
+    return Response('{"JP":' + jp + ',"GLOBAL":' + world + "}", mimetype="application/json")
+
+# The count routes are kept for existing clients and read the stats snapshot
 
 @app.route('/count_global_earthquakes')
 def count_global_quakes():
-    conn = create_snowflake_connection("GLOBAL")
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM all_earthquakes_week")
-        count = cur.fetchone()[0]
-        return jsonify({"count": count})
-    except snowflake.connector.Error as e:
-        print(f"Error counting global earthquakes: {e}")
-        return jsonify({"count": 0})
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    return stats_count("GLOBAL", "count")
 
 @app.route('/count_jp_earthquakes')
 def count_jp_quakes():
-    conn = create_snowflake_connection("JP")
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM all_jp_earthquakes WHERE lat IS NOT NULL AND lon IS NOT NULL")
-        count = cur.fetchone()[0]
-        return jsonify({"count": count})
-    except snowflake.connector.Error as e:
-        print(f"Error counting Japan earthquakes: {e}")
-        return jsonify({"count": 0})
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    return stats_count("JP", "count")
 
 @app.route("/count_significant_global_earthquakes")
 def count_significant_global_quakes():
-    conn = create_snowflake_connection("GLOBAL")
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM all_earthquakes_week WHERE magnitude >= 5.0")
-        count = cur.fetchone()[0]
-        return jsonify({"count": count})
-    except snowflake.connector.Error as e:
-        print(f"Error counting significant global earthquakes: {e}")
-        return jsonify({"count": 0})
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    return stats_count("GLOBAL", "significant")
 
 @app.route("/count_significant_jp_earthquakes")
 def count_significant_jp_quakes():
-    conn = create_snowflake_connection("JP")
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM all_jp_earthquakes WHERE magnitude >= 5.0 AND lat IS NOT NULL AND lon IS NOT NULL")
-        count = cur.fetchone()[0]
-        return jsonify({"count": count})
-    except snowflake.connector.Error as e:
-        print(f"Error counting significant Japan earthquakes: {e}")
-        return jsonify({"count": 0})
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    return stats_count("JP", "significant")
+
+def should_start_refresh_scheduler():
+    if os.getenv("YUUBOT_REFRESH_SCHEDULER", "1") != "1":
+        return False
+    # Under asgi.py the lifespan hooks start and stop the scheduler
+    if os.getenv("YUUBOT_ASGI") == "1":
+        return False
+    # Under the debug reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if __name__ == '__main__' and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        return False
+    return True
+
+if should_start_refresh_scheduler():
+    refresh_scheduler.start()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0' , port=4092)  # Adjust host and port as needed
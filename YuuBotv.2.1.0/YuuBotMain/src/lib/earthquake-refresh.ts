@@ -224,8 +224,10 @@ async function resetJapaneseOverallTable(schema: SnowflakeSchema) {
       magnitude FLOAT,
       intensity STRING,
       lat FLOAT,
-      lon FLOAT
-    )`,
+      lon FLOAT,
+      event_ts TIMESTAMP_NTZ
+    )
+    CLUSTER BY (TO_DATE(event_ts))`,
     [],
     schema,
   )
@@ -252,8 +254,10 @@ async function resetGlobalOverallTable(schema: SnowflakeSchema) {
       title STRING,
       tsunami BOOLEAN,
       lat FLOAT,
-      lon FLOAT
-    )`,
+      lon FLOAT,
+      event_ts TIMESTAMP_NTZ
+    )
+    CLUSTER BY (TO_DATE(event_ts))`,
     [],
     schema,
   )
@@ -277,7 +281,7 @@ export async function refreshJapaneseOverallEarthquakes(schema: SnowflakeSchema)
   await insertRows(
     schema,
     'all_jp_earthquakes',
-    ['date', 'time', 'epicenter', 'magnitude', 'intensity', 'lat', 'lon'],
+    ['date', 'time', 'epicenter', 'magnitude', 'intensity', 'lat', 'lon', 'event_ts'],
     rows.map((row) => [
       row.date,
       row.time,
@@ -286,6 +290,7 @@ export async function refreshJapaneseOverallEarthquakes(schema: SnowflakeSchema)
       row.intensity,
       row.latitude,
       row.longitude,
+      `${row.date} ${row.time}`,
     ]),
   )
 
@@ -313,7 +318,7 @@ export async function refreshGlobalOverallEarthquakes(schema: SnowflakeSchema) {
   await insertRows(
     schema,
     'all_earthquakes_week',
-    ['date', 'time', 'magnitude', 'location', 'title', 'tsunami', 'lat', 'lon'],
+    ['date', 'time', 'magnitude', 'location', 'title', 'tsunami', 'lat', 'lon', 'event_ts'],
     rows.map((row) => [
       row.date,
       row.time,
@@ -323,6 +328,7 @@ export async function refreshGlobalOverallEarthquakes(schema: SnowflakeSchema) {
       row.tsunami,
       row.latitude,
       row.longitude,
+      `${row.date} ${row.time}`,
     ]),
   )
 
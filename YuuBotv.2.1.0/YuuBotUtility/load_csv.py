@@ -2,11 +2,13 @@ import os
 import snowflake.connector
 import argparse
 import csv
+import json
 import sys
 from datetime import datetime, timezone
 from pathlib import Path
 import requests
 from dotenv import load_dotenv
+from warehouse_metrics import execute_tracked, metrics_snapshot
 
 env_path = Path(__file__).parent / ".env"
 load_dotenv(env_path)
@@ -64,12 +66,15 @@ def upload_csv_to_snowflake_stage(local_path: Path, stage_name: str = "EARTHQUAK
         password=password,
         warehouse=warehouse,
         database=database,
-        schema=schema
+        schema=schema,
+        session_parameters={"QUERY_TAG": "pipeline:load_csv"}
     )
     cur = conn.cursor()
     try:
         # ensure stage exists and create a simple CSV file format
-        cur.execute(
+        execute_tracked(
+            cur,
+            "pipeline:load_csv",
             f"CREATE STAGE IF NOT EXISTS {stage_name} "
             "FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 1 "
             "FIELD_OPTIONALLY_ENCLOSED_BY = '\"')"
@@ -80,9 +85,9 @@ def upload_csv_to_snowflake_stage(local_path: Path, stage_name: str = "EARTHQUAK
         file_uri = p.as_uri()
 
         # PUT the file to the named stage; overwrite if exists
-        cur.execute(f"PUT '{file_uri}' @{stage_name} AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
+        execute_tracked(cur, "pipeline:load_csv", f"PUT '{file_uri}' @{stage_name} AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
         # list files to confirm
-        cur.execute(f"LIST @{stage_name}")
+        execute_tracked(cur, "pipeline:load_csv", f"LIST @{stage_name}")
         rows = cur.fetchall()
         print("Stage contents:")
         for r in rows:
@@ -90,6 +95,7 @@ def upload_csv_to_snowflake_stage(local_path: Path, stage_name: str = "EARTHQUAK
     finally:
         cur.close()
         conn.close()
+        print(json.dumps({"event": "warehouse_summary", "tags": metrics_snapshot()}))
 
 def save_features_to_csv(features: list, out_path: Path):
     # gather all property keys
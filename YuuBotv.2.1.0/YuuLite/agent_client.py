@@ -0,0 +1,108 @@
+import os
+import threading
+import warnings
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import InsecureRequestWarning
+from urllib3.util.retry import Retry
+
+# Process-wide HTTP client for the Cortex agent :run endpoint. Streamlit re-runs
+# the chat script on every interaction, but imported modules stay loaded, so one
+# pooled keep-alive session here is shared by every browser session and turn:
+# only the first request pays for the TCP and TLS handshakes.
+#
+# Timeouts: connect is the time to open the socket; read is the longest gap
+# allowed between bytes of the response (the agent keeps streaming status events
+# while tools run, so this bounds a stalled stream, not the whole answer).
+CONNECT_TIMEOUT = float(os.getenv("YUUBOT_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("YUUBOT_READ_TIMEOUT", "180"))
+POOL_SIZE = int(os.getenv("YUUBOT_HTTP_POOL_SIZE", "10"))
+MAX_RETRIES = int(os.getenv("YUUBOT_HTTP_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("YUUBOT_HTTP_BACKOFF", "0.5"))
+RETRY_STATUSES = (429, 503)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def tls_verify_setting():
+    """
+    Read the TLS verification setting from YUUBOT_TLS_VERIFY.
+
+    Returns:
+    bool | str: True (the default), False when set to 0/false/no, or a CA bundle path.
+    """
+    value = os.getenv("YUUBOT_TLS_VERIFY", "1").strip()
+    if value.lower() in ("0", "false", "no"):
+        return False
+    if value.lower() in ("", "1", "true", "yes"):
+        return True
+    return value
+
+
+def build_session() -> requests.Session:
+    """
+    Build a requests session with a keep-alive connection pool and retries.
+
+    Connection errors and 429/503 responses are retried with exponential backoff,
+    honouring Retry-After. POST is retried only in those cases, where the agent has not
+    started a run; read errors are never retried, since the run may already be under way.
+
+    Returns:
+    requests.Session: The configured session.
+    """
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=0,
+        status=MAX_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "POST"}),
+        respect_retry_after_header=True,
+        # Hand the last 429/503 back to the caller so its body can be shown
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.verify = tls_verify_setting()
+    if session.verify is False:
+        print("Warning: TLS certificate verification is disabled (YUUBOT_TLS_VERIFY=0)")
+        warnings.simplefilter("ignore", InsecureRequestWarning)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def post_agent_run(url: str, body: str, token: str) -> requests.Response:
+    """
+    POST an agent :run request on the shared session and return the streaming response.
+
+    Parameters:
+    url (str): The agent :run endpoint.
+    body (str): The JSON request body.
+    token (str): The Snowflake personal access token.
+
+    Returns:
+    requests.Response: The response, with the body not yet read.
+    """
+    return get_session().post(
+        url,
+        data=body,
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        },
+        stream=True,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+    )
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from history_window import compact_message, window_history
+from sse_parser import SSEEvent
+
+# Process-wide cache of agent answers. Streamlit serves every browser session
+# from one process, so a question asked by one user (e.g. "what was the latest
+# quake in Japan") is answered for the next from the recorded event stream,
+# without another agent run. Entries are keyed by the normalized question, the
+# text of the conversation before it, and the ingest data version, so a new
+# refresh of the quake tables invalidates every cached answer at once.
+#
+# The version comes from a data version file written after each successful
+# ingest (refresh_data.py in YuuBot Chat v.1.2.1 does this). Not every ingest
+# writes one, so by default ("auto") answers are only cached while the file
+# exists. "1" caches without it too, falling back to a time bucket of
+# ANSWER_CACHE_TTL seconds so answers go stale on the TTL alone; "0" disables it.
+ANSWER_CACHE_TTL = int(os.getenv("YUUBOT_ANSWER_CACHE_TTL", "900"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("YUUBOT_ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("YUUBOT_ANSWER_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+ANSWER_CACHE_MODE = os.getenv("YUUBOT_ANSWER_CACHE", "auto")
+ANSWER_CACHE_ENABLED = ANSWER_CACHE_MODE != "0"
+DATA_VERSION_FILE = os.getenv(
+    "YUUBOT_DATA_VERSION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_version.json"),
+)
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?？!！.。]+$")
+_version_cache = {"mtime": None, "version": None}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Fold case, width and whitespace, and drop trailing punctuation, so trivially different phrasings share an entry."""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = " ".join(text.split())
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def _fallback_version() -> str | None:
+    # No version file: nothing tells us when the tables change, so only cache if asked to
+    if ANSWER_CACHE_MODE == "1":
+        return f"ttl:{int(time.time() // ANSWER_CACHE_TTL)}"
+    return None
+
+
+def current_data_version() -> str | None:
+    """
+    Return the ingest data version, re-reading the version file only when it changes.
+
+    Returns:
+    str | None: The file's contents. When the file does not exist, a TTL time bucket if
+        YUUBOT_ANSWER_CACHE=1, otherwise None (answers are not cached).
+    """
+    try:
+        mtime = os.stat(DATA_VERSION_FILE).st_mtime_ns
+    except OSError:
+        return _fallback_version()
+    if _version_cache["mtime"] != mtime:
+        try:
+            with open(DATA_VERSION_FILE, encoding="utf-8") as fh:
+                version = fh.read().strip()
+        except OSError:
+            return _fallback_version()
+        _version_cache["mtime"] = mtime
+        _version_cache["version"] = version
+    return _version_cache["version"]
+
+
+def _message_text(message: dict) -> str:
+    return " ".join(item.get("text", "") for item in message.get("content") or [] if item.get("type") == "text")
+
+
+def answer_key(messages: list, agent: str) -> str | None:
+    """
+    Build the cache key for answering the last message of a conversation.
+
+    Parameters:
+    messages (list[Message]): The conversation, ending with the new user question.
+    agent (str): The agent name, so apps sharing a cache never mix answers.
+
+    Returns:
+    str | None: A hex digest, or None when the last message has no question text or there
+        is no data version to key on.
+    """
+    dicts = [message.to_dict() for message in messages]
+    if not dicts or dicts[-1].get("role") != "user":
+        return None
+    question = normalize_prompt(_message_text(dicts[-1]))
+    version = current_data_version()
+    if not question or version is None:
+        return None
+    # The history the agent would see, reduced to its text: re-running a tool on
+    # the same data would produce the same answer, so bulky outputs need not match
+    window = window_history(dicts)
+    history = [compact_message(message) for message in window[:-1]]
+    payload = json.dumps([agent, version, history, question], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, ttl_seconds=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES, max_bytes=ANSWER_CACHE_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Return the cached events for key, or None on a miss or expired entry.
+
+        Parameters:
+        key (str): The key from answer_key().
+
+        Returns:
+        list | None: The recorded {"event", "data"} dicts.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, events):
+        """
+        Store the events of a completed answer.
+
+        Only streams that finished with a response event and no error are kept, and
+        streams larger than max_bytes are skipped.
+
+        Parameters:
+        key (str): The key from answer_key().
+        events (list): The events recorded by stream_events.
+        """
+        names = {event["event"] for event in events}
+        if "response" not in names or "error" in names:
+            return
+        stored = [{"event": event["event"], "data": event["data"]} for event in events]
+        if sum(len(event["data"]) for event in stored) > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the hit/miss counters and current size as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def replay_events(events: list) -> list:
+    """Turn cached event dicts back into parser events for stream_events."""
+    return [SSEEvent(event["event"], event["data"]) for event in events]
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,132 @@
+"""
+Incremental Server-Sent Events parser for the agent :run stream.
+
+Works on raw byte chunks as they come off the socket: complete events are cut at
+blank-line boundaries, each event block is decoded once, and only the unfinished
+tail is carried over to the next chunk. Handles the `event`, `data`, `id` and
+`retry` fields, comment lines, CRLF/CR line endings and a leading BOM.
+"""
+
+from typing import Iterable, Iterator
+
+_BOM = b"\xef\xbb\xbf"
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id", "retry")
+
+    def __init__(self, event: str = "message", data: str = "", id: str | None = None, retry: int | None = None):
+        self.event = event
+        self.data = data
+        self.id = id
+        self.retry = retry
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(event={self.event!r}, data={self.data[:60]!r}, id={self.id!r}, retry={self.retry!r})"
+
+
+class SSEParser:
+    def __init__(self):
+        self._buffer = bytearray()
+        self._started = False
+        self._after_cr = False
+        self.last_event_id: str | None = None
+
+    def _normalize(self, chunk: bytes) -> bytes:
+        # CRLF and lone CR become LF; a CRLF split across two chunks leaves an LF to drop
+        if self._after_cr and chunk[:1] == b"\n":
+            chunk = chunk[1:]
+        self._after_cr = False
+        if b"\r" in chunk:
+            self._after_cr = chunk.endswith(b"\r")
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        return chunk
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        """
+        Add a chunk of the stream and return the events it completed.
+
+        Parameters:
+        chunk (bytes): The next bytes of the stream, split anywhere.
+
+        Returns:
+        list[SSEEvent]: Events whose terminating blank line is now in the buffer.
+        """
+        buffer = self._buffer
+        # Only the new bytes (plus one, for a boundary straddling the chunks) need scanning
+        scan_from = max(len(buffer) - 1, 0)
+        buffer += self._normalize(chunk)
+        if not self._started:
+            if len(buffer) < len(_BOM) and _BOM.startswith(buffer):
+                return []
+            if buffer.startswith(_BOM):
+                del buffer[:len(_BOM)]
+                scan_from = 0
+            self._started = True
+
+        end = buffer.rfind(b"\n\n", scan_from)
+        if end == -1:
+            return []
+        complete = bytes(buffer[:end])
+        del buffer[:end + 2]
+        return self._parse_blocks(complete)
+
+    def finish(self) -> list[SSEEvent]:
+        """Flush an event left unterminated at the end of the stream."""
+        remaining = bytes(self._buffer).strip(b"\n")
+        self._buffer.clear()
+        return self._parse_blocks(remaining) if remaining else []
+
+    def _parse_blocks(self, raw: bytes) -> list[SSEEvent]:
+        events = []
+        for block in raw.decode("utf-8", errors="replace").split("\n\n"):
+            event = self._parse_block(block)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _parse_block(self, block: str) -> SSEEvent | None:
+        event_name = None
+        data = None
+        retry = None
+        for line in block.split("\n"):
+            if not line or line[0] == ":":
+                continue
+            field, sep, value = line.partition(":")
+            if sep and value[:1] == " ":
+                value = value[1:]
+            if field == "data":
+                # Most events carry a single data line; only multi-line data is joined
+                data = value if data is None else data + "\n" + value
+            elif field == "event":
+                event_name = value
+            elif field == "id":
+                if "\0" not in value:
+                    self.last_event_id = value
+            elif field == "retry":
+                if value.isdigit():
+                    retry = int(value)
+        if data is None and event_name is None:
+            return None
+        return SSEEvent(event_name or "message", data or "", self.last_event_id, retry)
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[SSEEvent]:
+    """Parse an iterable of byte chunks, yielding events as soon as they are complete."""
+    parser = SSEParser()
+    for chunk in chunks:
+        if chunk:
+            yield from parser.feed(chunk)
+    yield from parser.finish()
+
+
+def iter_sse_response(response) -> Iterator[SSEEvent]:
+    """Parse a streaming requests.Response, reading whatever the socket has as it arrives."""
+    return iter_sse_events(response.iter_content(chunk_size=None))
+
+
+def parse_sse_text(text: str | bytes) -> list[SSEEvent]:
+    """Parse a complete SSE payload."""
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    return list(iter_sse_events([text]))
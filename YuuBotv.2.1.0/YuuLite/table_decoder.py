@@ -0,0 +1,101 @@
+import csv
+import io
+import os
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+# Typed DataFrames for agent table results. The SQL API sends every value as a
+# string (numbers as text, dates as days since the epoch, timestamps as epoch
+# seconds), with the real types in result_set_meta_data.row_type. Each column
+# is pulled out of the rows with one map() and goes through one vectorized
+# conversion to its own dtype, instead of building a 2-D string array and a
+# frame of object columns from it. Only the first TABLE_MAX_ROWS rows are
+# decoded for display; the full result is offered as a CSV download.
+TABLE_MAX_ROWS = int(os.getenv("YUUBOT_TABLE_MAX_ROWS", "5000"))
+
+
+def _numeric(values, dtype):
+    try:
+        return np.array(values, dtype=dtype)
+    except (TypeError, ValueError, OverflowError):
+        # Nulls, or integers too wide for int64
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy()
+
+
+def _epoch_or_text(values, unit):
+    try:
+        return pd.to_datetime(np.array(values, dtype=np.float64), unit=unit)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce")
+    # Not epoch numbers and not dates either: keep the text
+    return parsed if parsed.notna().any() else pd.Series(values, dtype=object)
+
+
+def decode_column(values, column_type):
+    """
+    Convert one column of SQL API strings to its Snowflake type.
+
+    Parameters:
+    values (list): The column's values as sent (strings or None).
+    column_type (RowType): The column's entry in result_set_meta_data.row_type.
+
+    Returns:
+    array-like: A typed column for pd.DataFrame.
+    """
+    kind = (column_type.type or "").lower()
+    if kind == "fixed":
+        return _numeric(values, np.int64 if column_type.scale == 0 else np.float64)
+    if kind in ("real", "float", "double"):
+        return _numeric(values, np.float64)
+    if kind == "boolean":
+        return pd.array([None if v is None else v.lower() in ("true", "1") for v in values], dtype="boolean")
+    if kind == "date":
+        return _epoch_or_text(values, "D")
+    if kind in ("timestamp_ntz", "timestamp_ltz"):
+        return _epoch_or_text(values, "s")
+    if kind == "timestamp_tz":
+        # "<epoch seconds> <offset>": show the instant in UTC
+        return _epoch_or_text([None if v is None else v.split(" ", 1)[0] for v in values], "s")
+    if kind == "time":
+        try:
+            return pd.to_timedelta(np.array(values, dtype=np.float64), unit="s")
+        except (TypeError, ValueError):
+            return pd.Series(values, dtype=object)
+    return pd.Series(values, dtype=object)
+
+
+def decode_result_set(result_set, max_rows=TABLE_MAX_ROWS):
+    """
+    Build a typed DataFrame from an agent result set.
+
+    Parameters:
+    result_set (ResultSet): The table's result set.
+    max_rows (int): How many rows to decode; the rest are left for the download.
+
+    Returns:
+    tuple: (pd.DataFrame, int) the frame and the total number of rows in the result.
+    """
+    row_type = result_set.result_set_meta_data.row_type
+    rows = result_set.data or []
+    total = len(rows)
+    shown = rows[:max_rows] if total > max_rows else rows
+    columns = [list(map(itemgetter(i), shown)) for i in range(len(row_type))]
+    frame = pd.DataFrame({
+        # Position-keyed so duplicate column names survive; renamed below
+        i: decode_column(values, column_type)
+        for i, (values, column_type) in enumerate(zip(columns, row_type))
+    })
+    frame.columns = [column_type.name for column_type in row_type]
+    return frame, total
+
+
+def result_set_csv(result_set) -> bytes:
+    """Write the whole result set, as sent, to CSV for the download button."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column_type.name for column_type in result_set.result_set_meta_data.row_type])
+    writer.writerows(result_set.data or [])
+    return buffer.getvalue().encode("utf-8")
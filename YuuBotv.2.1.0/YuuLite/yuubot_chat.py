@@ -1,15 +1,17 @@
 import json
 import os
+import time
 from collections import defaultdict
 
-import numpy as np
-import pandas as pd
 import requests
 import sseclient
 import streamlit as st
 import weave
 from dotenv import load_dotenv
 
+from agent_client import post_agent_run
+from answer_cache import ANSWER_CACHE_ENABLED, answer_cache, answer_key, replay_events
+from history_window import window_messages
 from models import (
     ChartEventData,
     DataAgentRunRequest,
@@ -25,6 +27,9 @@ from models import (
     ToolResultEventData,
     ToolUseEventData,
 )
+from sse_parser import iter_sse_response, parse_sse_text
+from stream_recorder import record_stream
+from table_decoder import decode_result_set, result_set_csv
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 PAT = os.getenv("SNOWFLAKE_PAT")
@@ -32,29 +37,26 @@ HOST = os.getenv("SNOWFLAKE_HOST")
 DATABASE = "YUUBOT_DB"
 SCHEMA = "GLOBAL"
 AGENT = "YUUBOT_CHAT"
+AGENT_URL = f"https://{HOST}/api/v2/databases/{DATABASE}/schemas/{SCHEMA}/agents/{AGENT}:run"
+# Streaming text is redrawn at most this often (seconds), however fast deltas arrive
+RENDER_INTERVAL = float(os.getenv("YUUBOT_RENDER_INTERVAL", "0.1"))
+
+# Model name the Weave cost entry is registered under; analyze_events reports usage against it
+COST_LLM_ID = "auto"
 
 wandb_api_key = os.getenv("WANDB_API_KEY")
 client = weave.init("yuuchat-v210-model-dev")
 
 client.add_cost(
-    llm_id="auto", # Must match the 'model' key in your trace
+    llm_id=COST_LLM_ID, # Must match the 'model' key in your trace
     prompt_token_cost=0.000003,  # Adjusted for your Snowflake credit price
     completion_token_cost=0.000015 
 )
 
 @weave.op()
 def agent_run_weave(messages: list) -> dict:
-    request_body = DataAgentRunRequest(model="claude-4-sonnet", messages=messages)
-    resp = requests.post(
-        url=f"https://{HOST}/api/v2/databases/{DATABASE}/schemas/{SCHEMA}/agents/{AGENT}:run",
-        data=request_body.to_json(),
-        headers={
-            "Authorization": f"Bearer {PAT}",
-            "Content-Type": "application/json",
-        },
-        stream=True,
-        verify=False,
-    )
+    request_body = DataAgentRunRequest(model="claude-4-sonnet", messages=window_messages(messages))
+    resp = post_agent_run(AGENT_URL, request_body.to_json(), PAT)
 
     # Try to parse JSON body; if not JSON, attempt to parse SSE-style payload
     events = []
@@ -69,34 +71,7 @@ def agent_run_weave(messages: list) -> dict:
         text = resp.text or ""
         # simple heuristic: treat as SSE if it contains `event:` lines
         if "event:" in text:
-            def _parse_sse_text(s: str):
-                out = []
-                data_lines = []
-                event_name = None
-                for raw in s.splitlines():
-                    line = raw.rstrip("\n")
-                    if line == "":
-                        if data_lines or event_name is not None:
-                            out.append({"event": event_name or "message", "data": "\n".join(data_lines)})
-                        data_lines = []
-                        event_name = None
-                        continue
-                    if line.startswith(":"):
-                        continue
-                    if ":" in line:
-                        field, value = line.split(":", 1)
-                        value = value.lstrip()
-                    else:
-                        field, value = line, ""
-                    if field == "event":
-                        event_name = value
-                    elif field == "data":
-                        data_lines.append(value)
-                if data_lines or event_name is not None:
-                    out.append({"event": event_name or "message", "data": "\n".join(data_lines)})
-                return out
-
-            events = _parse_sse_text(text)
+            events = [{"event": ev.event, "data": ev.data} for ev in parse_sse_text(text)]
             body = {"text": text}
         else:
             body = {"text": resp.text}
@@ -104,100 +79,136 @@ def agent_run_weave(messages: list) -> dict:
     return {"status": resp.status_code, "body": body, "events": events, "headers": dict(resp.headers)}
 
 
+def _mark(latency: dict, phase: str, t: float | None) -> None:
+    # Keep the first time each phase is reached
+    if t is not None and phase not in latency:
+        latency[phase] = t
+
+
+def reported_usage(metadata) -> dict | None:
+    """
+    Sum the tokens_consumed entries of a response event's metadata.
+
+    Parameters:
+    metadata (dict): The response event's "metadata" object.
+
+    Returns:
+    dict | None: {"prompt_tokens", "completion_tokens", "total_tokens", "cache_read_tokens",
+    "models"}, or None when the agent did not report usage.
+    """
+    consumed = ((metadata or {}).get("usage") or {}).get("tokens_consumed") if isinstance(metadata, dict) else None
+    if not consumed:
+        return None
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+
+    def total(value):
+        return value.get("total", 0) if isinstance(value, dict) else (value or 0)
+
+    prompt_tokens = sum(total(entry.get("input_tokens")) for entry in consumed)
+    completion_tokens = sum(total(entry.get("output_tokens")) for entry in consumed)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cache_read_tokens": sum((entry.get("input_tokens") or {}).get("cache_read", 0) for entry in consumed if isinstance(entry.get("input_tokens"), dict)),
+        "models": [entry.get("model_name") for entry in consumed if entry.get("model_name")],
+    }
+
+
 @weave.op()
-def analyze_events(events: list) -> dict:
-    """Weave-op: summarize events and extract assistant text where possible."""
+def analyze_events(events: list, cached: bool = False) -> dict:
+    """
+    Weave-op: summarize a recorded event stream in a single pass.
+
+    Each event's data is JSON-decoded once and dispatched on the event type. Token usage
+    is the tokens_consumed the agent reports in the final response event's metadata
+    (estimated at ~4 characters per token only when it is missing), and per-phase
+    latencies come from the "t" offsets recorded by stream_events.
+
+    With cached=True the events did not come from a new agent run (a replayed answer, or
+    a stream already analyzed), so the usage Weave bills is zero; the recorded run's
+    tokens stay in usage_details["replayed"].
+    """
     counts: dict = {}
     samples: list = []
     assistant_texts: list = []
-    tokens = 0
+    deltas = defaultdict(list)
+    latency: dict = {}
+    tool_started: dict = {}
+    tool_seconds = 0.0
+    usage = None
 
     for ev in events or []:
-        name = ev.get("event") if isinstance(ev, dict) else None
-        if not name:
-            name = "message"
+        name = ev.get("event") or "message"
+        raw = ev.get("data") or ""
+        t = ev.get("t")
         counts[name] = counts.get(name, 0) + 1
-        # keep a small preview
+        if len(samples) < 10:
+            samples.append(raw[:300])
         try:
-            data = ev.get("data") if isinstance(ev, dict) else str(ev)
-        except Exception:
-            data = str(ev)
-        if isinstance(data, str):
-            samples.append(data[:300])
-            # Try to parse assistant message JSON inside data
-            # Try to extract structured assistant text. Prefer Message.from_json,
-            # but fall back to extracting any `text` fields when parsing fails
-            extracted = []
-            if isinstance(data, str):
-                try:
-                    m = Message.from_json(data)
-                    extracted.append("\n".join([c.actual_instance.text for c in m.content if getattr(c.actual_instance, 'type', '') == 'text']))
-                except Exception as e:
-                    # If parsing fails (e.g. server-side validation like "Last message must be from user"),
-                    # try to parse JSON and recursively extract `text` fields; otherwise fall back to raw data.
-                    try:
-                        parsed = json.loads(data)
-                    except Exception:
-                        if name == "response":
-                            extracted.append(data)
-                    else:
-                        def _extract_texts(obj):
-                            texts = []
-                            if isinstance(obj, dict):
-                                for k, v in obj.items():
-                                    if k == "text" and isinstance(v, str):
-                                        texts.append(v)
-                                    else:
-                                        texts.extend(_extract_texts(v))
-                            elif isinstance(obj, list):
-                                for it in obj:
-                                    texts.extend(_extract_texts(it))
-                            return texts
-
-                        extracted.extend([t for t in _extract_texts(parsed) if t])
-            # Append any extracted texts
-            assistant_texts.extend(extracted)
-        
-        if name == "response":
-            m = Message.from_json(data)
-            # extract tokens_consumed from metadata if present
-            try:
-                meta = getattr(m, "metadata", None)
-                if isinstance(meta, str):
-                    meta = json.loads(meta)
-                if isinstance(meta, dict):
-                    usage = meta.get("usage", {})
-                    tokens_consumed = usage.get("tokens_consumed")
+            data = json.loads(raw) if raw else {}
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            if name == "response" and raw:
+                assistant_texts.append(raw)
+            continue
+
+        match name:
+            case "response.status":
+                _mark(latency, "first_status", t)
+            case "response.thinking.delta":
+                _mark(latency, "first_thinking", t)
+            case "response.text.delta":
+                _mark(latency, "first_token", t)
+                deltas[data.get("content_index", 0)].append(data.get("text") or "")
+            case "response.tool_use":
+                _mark(latency, "first_tool_use", t)
+                if t is not None:
+                    tool_started[data.get("tool_use_id")] = t
+            case "response.tool_result":
+                started = tool_started.pop(data.get("tool_use_id"), None)
+                if started is not None and t is not None:
+                    tool_seconds += t - started
+            case "response":
+                _mark(latency, "completion", t)
+                for item in data.get("content") or []:
+                    if isinstance(item, dict) and item.get("type") == "text" and item.get("text"):
+                        assistant_texts.append(item["text"])
+                usage = reported_usage(data.get("metadata")) or usage
+            case "error":
+                assistant_texts.append(f"Error: {data.get('message')} (code: {data.get('code')})")
 
-                    if tokens_consumed:
-                        # add the raw tokens_consumed structure to assistant_texts for inspection
-                        assistant_texts.append(json.dumps(tokens_consumed))
+    if not assistant_texts and deltas:
+        # The stream ended without a final response event: use the streamed text
+        assistant_texts = ["".join(parts) for _, parts in sorted(deltas.items())]
+    if tool_seconds:
+        latency["tool_seconds"] = round(tool_seconds, 4)
 
-            except Exception as e:
-                # ignore metadata parsing errors
-                print("Failed to parse tokens_consumed from metadata ", e)
-                pass
-
-            extracted.append("\n".join([c.actual_instance.text for c in m.content if getattr(c.actual_instance, 'type', '') == 'text']))
-            tokens += sum(len(t.split()) for t in extracted)
-                
-    # Build output and token usage summary
-    prompt_tokens = sum(len(s.split()) for s in samples)
-    completion_tokens = tokens
+    if usage is None:
+        # Not reported by the agent: rough estimate, flagged as such
+        completion_tokens = sum(len(text) for text in assistant_texts) // 4
+        usage = {"prompt_tokens": 0, "completion_tokens": completion_tokens, "total_tokens": completion_tokens, "estimated": True}
+    if cached:
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached": True, "replayed": usage}
 
     return {
         "output": {
             "counts": counts,
-            "samples": samples[:10],
+            "samples": samples,
             "assistant_texts": assistant_texts[:10],
-            "tokens": tokens,
+            "tokens": usage["total_tokens"],
+            "latency": latency,
+            "cached": cached,
         },
-        "model": "claude-3-5-sonnet",
+        "model": COST_LLM_ID,
         "usage": {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "total_tokens": usage["total_tokens"],
         },
+        "usage_details": usage,
     }
 
 
@@ -205,30 +216,77 @@ def agent_run() -> requests.Response:
     """Calls the REST API and returns a streaming client."""
     request_body = DataAgentRunRequest(
         model="claude-4-sonnet",
-        messages=st.session_state.messages,
-    )
-    resp = requests.post(
-        url=f"https://{HOST}/api/v2/databases/{DATABASE}/schemas/{SCHEMA}/agents/{AGENT}:run",
-        data=request_body.to_json(),
-        headers={
-            "Authorization": f"Bearer {PAT}",
-            "Content-Type": "application/json",
-        },
-        stream=True,
-        verify=False,
+        # Recent turns verbatim, older ones compacted, within the history token budget
+        messages=window_messages(st.session_state.messages),
     )
+    resp = post_agent_run(AGENT_URL, request_body.to_json(), PAT)
     if resp.status_code < 400:
-        return resp  # type: ignore
+        # Copied to YUUBOT_RECORD_DIR for replay_stream.py when recording is enabled
+        return record_stream(resp)  # type: ignore
     else:
         raise Exception(f"Failed request with status {resp.status_code}: {resp.text}")
 
 
-def stream_events(response: requests.Response):
+class DeltaRenderer:
+    """
+    Coalesce text and thinking deltas and redraw each section at a bounded rate.
+
+    Deltas are only appended to a per-section list; flush() joins and writes the sections
+    that changed since the last draw, at most once per interval. The thinking expander is
+    created once per section, with a placeholder inside it that is rewritten in place.
+    """
+
+    def __init__(self, content_map, interval: float = RENDER_INTERVAL):
+        self.content_map = content_map
+        self.interval = interval
+        self.parts = defaultdict(list)
+        self.targets = {}
+        self.dirty = set()
+        self.last_flush = 0.0
+
+    def add(self, index: int, text: str, thinking: bool = False) -> None:
+        if index not in self.targets:
+            section = self.content_map[index]
+            self.targets[index] = section.expander("Thinking", expanded=True).empty() if thinking else section
+        self.parts[index].append(text)
+        self.dirty.add(index)
+        if time.perf_counter() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        for index in self.dirty:
+            parts = self.parts[index]
+            if len(parts) > 1:
+                parts[:] = ["".join(parts)]
+            self.targets[index].write(parts[0])
+        self.dirty.clear()
+        self.last_flush = time.perf_counter()
+
+    def discard(self, index: int) -> None:
+        """Forget a section whose final content is about to be drawn over it."""
+        self.parts.pop(index, None)
+        self.targets.pop(index, None)
+        self.dirty.discard(index)
+
+
+def stream_events(response, started_at: float | None = None) -> list:
+    """
+    Render the agent's SSE stream and return the events it consumed.
+
+    response is either the streaming requests.Response from agent_run or an iterable of
+    already-parsed events (a cached answer being replayed); both render the same way.
+    Each event is recorded as {"event", "data", "t"}, where t is seconds since started_at
+    (the perf_counter() time the request was sent; defaults to now), so the trace can be
+    analyzed without running the agent a second time.
+    """
+    if started_at is None:
+        started_at = time.perf_counter()
+    recorded = []
     content = st.container()
     # Content index to container section mapping
     content_map = defaultdict(content.empty)
-    # Content index to text buffer
-    buffers = defaultdict(str)
+    # Coalesces text/thinking deltas so the page is redrawn at a bounded rate, not per token
+    renderer = DeltaRenderer(content_map)
     spinner = st.spinner("Waiting for response...")
     spinner.__enter__()
 
@@ -236,129 +294,89 @@ def stream_events(response: requests.Response):
     # try to open it with requests (which led to InvalidURL / MissingSchema
     # when we passed non-URL objects). To avoid depending on the library's
     # constructor behavior, parse the Server-Sent Events ourselves from the
-    # streaming response.iter_lines(). This yields lightweight objects with
-    # `.event` and `.data` which the rest of this function expects.
-
-    class _SSEEvent:
-        def __init__(self, event: str | None, data: str):
-            self.event = event or "message"
-            self.data = data
-
-    def _iter_sse_events(resp: requests.Response):
-        data_lines: list[str] = []
-        event_name = None
-
-        for raw in resp.iter_lines(decode_unicode=True):
-            if raw is None:
-                continue
-            line = raw.rstrip("\n")
-            # blank line -> dispatch event
-            if line == "":
-                if data_lines or event_name is not None:
-                    data = "\n".join(data_lines)
-                    yield _SSEEvent(event_name, data)
-                data_lines = []
-                event_name = None
-                continue
-
-            # comments start with ':'
-            if line.startswith(":"):
-                continue
-
-            if ":" in line:
-                field, value = line.split(":", 1)
-                value = value.lstrip()
-            else:
-                field, value = line, ""
-
-            if field == "event":
-                event_name = value
-            elif field == "data":
-                data_lines.append(value)
-            # ignore other fields (id, retry)
-
-        # end of stream: flush any pending event
-        if data_lines or event_name is not None:
-            data = "\n".join(data_lines)
-            yield _SSEEvent(event_name, data)
-
-    events = _iter_sse_events(response)
-    for event in events:
-        match event.event:
-            case "response.status":
-                spinner.__exit__(None, None, None)
-                data = StatusEventData.from_json(event.data)
-                spinner = st.spinner(data.message)
-                spinner.__enter__()
-            case "response.text.delta":
-                data = TextDeltaEventData.from_json(event.data)
-                buffers[data.content_index] += data.text
-                content_map[data.content_index].write(buffers[data.content_index])
-            case "response.thinking.delta":
-                data = ThinkingDeltaEventData.from_json(event.data)
-                buffers[data.content_index] += data.text
-                content_map[data.content_index].expander(
-                    "Thinking", expanded=True
-                ).write(buffers[data.content_index])
-            case "response.thinking":
-                # Thinking done, close the expander
-                data = ThinkingEventData.from_json(event.data)
-                content_map[data.content_index].expander("Thinking").write(data.text)
-            case "response.tool_use":
-                data = ToolUseEventData.from_json(event.data)
-                content_map[data.content_index].expander("Tool use").json(data)
-            case "response.tool_result":
-                try:
-                    data = ToolResultEventData.from_json(event.data)
-                    content_map[data.content_index].expander("Tool result").json(data)
-                except json.JSONDecodeError:
-                    # If the event data is not valid JSON, show an error and surface the raw payload
-                    st.error("Failed to decode tool result JSON; showing raw data instead.")
-                    # Use a safe default container index when parsing failed
-                    content_map[0].expander("Tool result (raw)").text(event.data)
-                except Exception as e:
-                    # Catch other unexpected parsing errors and show raw payload for debugging
-                    st.error(f"Error parsing tool result: {e}")
-                    content_map[0].expander("Tool result (raw)").text(event.data)
-            case "response.chart":
-                data = ChartEventData.from_json(event.data)
-                spec = json.loads(data.chart_spec)
-                content_map[data.content_index].vega_lite_chart(
-                    spec,
-                    use_container_width=True,
-                )
-            case "response.table":
-                data = TableEventData.from_json(event.data)
-                data_array = np.array(data.result_set.data)
-                column_names = [
-                    col.name for col in data.result_set.result_set_meta_data.row_type
-                ]
-                content_map[data.content_index].dataframe(
-                    pd.DataFrame(data_array, columns=column_names)
-                )
-            case "error":
-                data = ErrorEventData.from_json(event.data)
-                st.error(f"Error: {data.message} (code: {data.code})")
-                # Remove last user message, so we can retry from last successful response.
-                st.session_state.messages.pop()
-                return
-            case "response":
-                try:
-                    data = Message.from_json(event.data)
-                except json.JSONDecodeError:
-                    st.error("Failed to decode response JSON; showing raw text instead.")
-                    data = Message(
-                        role="assistant",
-                        content=[MessageContentItem(TextContentItem(type="text", text=event.data))],
-                    )
-                except Exception as e:
-                    st.error(f"Error parsing response: {e}")
-                    data = Message(
-                        role="assistant",
-                        content=[MessageContentItem(TextContentItem(type="text", text=event.data))],
+    # raw response bytes with the shared incremental parser (sse_parser.py).
+    events = iter_sse_response(response) if isinstance(response, requests.Response) else response
+    try:
+        for event in events:
+            recorded.append({"event": event.event, "data": event.data, "t": round(time.perf_counter() - started_at, 4)})
+            if renderer.dirty and event.event not in ("response.text.delta", "response.thinking.delta"):
+                # Show the text streamed so far before anything else is drawn (or a tool starts running)
+                renderer.flush()
+            match event.event:
+                case "response.status":
+                    spinner.__exit__(None, None, None)
+                    data = StatusEventData.from_json(event.data)
+                    spinner = st.spinner(data.message)
+                    spinner.__enter__()
+                case "response.text.delta":
+                    data = TextDeltaEventData.from_json(event.data)
+                    renderer.add(data.content_index, data.text)
+                case "response.thinking.delta":
+                    data = ThinkingDeltaEventData.from_json(event.data)
+                    renderer.add(data.content_index, data.text, thinking=True)
+                case "response.thinking":
+                    # Thinking done, close the expander
+                    data = ThinkingEventData.from_json(event.data)
+                    renderer.discard(data.content_index)
+                    content_map[data.content_index].expander("Thinking").write(data.text)
+                case "response.tool_use":
+                    data = ToolUseEventData.from_json(event.data)
+                    content_map[data.content_index].expander("Tool use").json(data)
+                case "response.tool_result":
+                    try:
+                        data = ToolResultEventData.from_json(event.data)
+                        content_map[data.content_index].expander("Tool result").json(data)
+                    except json.JSONDecodeError:
+                        # If the event data is not valid JSON, show an error and surface the raw payload
+                        st.error("Failed to decode tool result JSON; showing raw data instead.")
+                        # Use a safe default container index when parsing failed
+                        content_map[0].expander("Tool result (raw)").text(event.data)
+                    except Exception as e:
+                        # Catch other unexpected parsing errors and show raw payload for debugging
+                        st.error(f"Error parsing tool result: {e}")
+                        content_map[0].expander("Tool result (raw)").text(event.data)
+                case "response.chart":
+                    data = ChartEventData.from_json(event.data)
+                    spec = json.loads(data.chart_spec)
+                    content_map[data.content_index].vega_lite_chart(
+                        spec,
+                        use_container_width=True,
                     )
-                st.session_state.messages.append(data)
-    spinner.__exit__(None, None, None)
+                case "response.table":
+                    data = TableEventData.from_json(event.data)
+                    if data.result_set is not None:
+                        render_table(
+                            content_map[data.content_index].container(),
+                            build_table(data.result_set),
+                            f"table-stream-{data.content_index}",
+                        )
+                case "error":
+                    data = ErrorEventData.from_json(event.data)
+                    st.error(f"Error: {data.message} (code: {data.code})")
+                    # Remove last user message, so we can retry from last successful response.
+                    st.session_state.messages.pop()
+                    return recorded
+                case "response":
+                    try:
+                        data = Message.from_json(event.data)
+                    except json.JSONDecodeError:
+                        st.error("Failed to decode response JSON; showing raw text instead.")
+                        data = Message(
+                            role="assistant",
+                            content=[MessageContentItem(TextContentItem(type="text", text=event.data))],
+                        )
+                    except Exception as e:
+                        st.error(f"Error parsing response: {e}")
+                        data = Message(
+                            role="assistant",
+                            content=[MessageContentItem(TextContentItem(type="text", text=event.data))],
+                        )
+                    st.session_state.messages.append(data)
+    finally:
+        # Final flush, also on an error event or exception: draw whatever arrived since the last frame
+        renderer.flush()
+        spinner.__exit__(None, None, None)
+    return recorded
 
 
 def process_new_message(prompt: str) -> None:
@@ -366,34 +384,37 @@ def process_new_message(prompt: str) -> None:
         role="user",
         content=[MessageContentItem(TextContentItem(type="text", text=prompt))],
     )
-    render_message(message)
+    render_message(message, len(st.session_state.messages))
     st.session_state.messages.append(message)
 
     with st.chat_message("assistant"):
-        with st.spinner("Sending request..."):
-            response = agent_run()
+        started_at = time.perf_counter()
+        # Same question, same conversation so far, same ingest version: replay the recorded answer
+        cache_key = answer_key(st.session_state.messages, AGENT) if ANSWER_CACHE_ENABLED else None
+        cached = answer_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            st.caption("Answered from cache")
+            events = stream_events(replay_events(cached), started_at=started_at)
+        else:
+            with st.spinner("Sending request..."):
+                response = agent_run()
 
-        st.markdown(
-            f"```request_id: {response.headers.get('X-Snowflake-Request-Id')}```"
-        )
-        stream_events(response)
+            st.markdown(
+                f"```request_id: {response.headers.get('X-Snowflake-Request-Id')}```"
+            )
+            try:
+                events = stream_events(response, started_at=started_at)
+            finally:
+                # Hand the pooled connection back (or drop it, if the stream ended early)
+                response.close()
+            if cache_key:
+                answer_cache.put(cache_key, events)
+        # Keep the streamed events for the sidebar instead of re-running the agent to get them
+        st.session_state.last_events = events
 
-        # After streaming completes, fetch a non-streaming event dump and analyze it.
         try:
-            with st.spinner("Analyzing event trace..."):
-                # Ensure the last message is from the user when calling non-streaming run,
-                # otherwise the API may reject (e.g., "Last message must be from user").
-                msgs = list(st.session_state.messages)
-                while msgs and getattr(msgs[-1], "role", None) != "user":
-                    msgs.pop()
-                if not msgs:
-                    st.info("No user message available for event fetch; using full history.")
-                    resp = agent_run_weave(st.session_state.messages)
-                else:
-                    resp = agent_run_weave(msgs)
-                events = resp.get("events") or []
-                print(events)
-                summary = analyze_events(events)
+            # A replayed answer cost nothing; don't bill its recorded usage again
+            summary = analyze_events(events, cached=cached is not None)
         except Exception as e:
             st.sidebar.error(f"Event analysis failed: {e}")
         else:
@@ -405,31 +426,113 @@ def process_new_message(prompt: str) -> None:
                 for s in out.get("samples", []):
                     st.code(s)
                 st.write("**Tokens**")
-                st.write(out.get("tokens", 0))
+                st.json(summary.get("usage_details", {}))
+                st.write("**Latency (s)**")
+                st.json(out.get("latency", {}))
 
 
-def render_message(msg: Message):
+def build_table(result_set) -> dict:
+    """
+    Decode an agent table for display.
+
+    Parameters:
+    result_set (ResultSet): The table's result set.
+
+    Returns:
+    dict: The typed frame, the total row count, and the full-result CSV when the frame is truncated.
+    """
+    frame, total = decode_result_set(result_set)
+    return {
+        "frame": frame,
+        "total": total,
+        "csv": result_set_csv(result_set) if total > len(frame) else None,
+        "file_name": f"{result_set.statement_handle or 'result'}.csv",
+    }
+
+
+def render_table(container, table: dict, key: str) -> None:
+    """
+    Show a decoded table, with a CSV download of the whole result when it was truncated.
+
+    Parameters:
+    container: The Streamlit container to draw into.
+    table (dict): The output of build_table().
+    key (str): A widget key unique on the page, for the download button.
+    """
+    frame = table["frame"]
+    container.dataframe(frame)
+    if table["csv"] is not None:
+        container.caption(f"Showing the first {len(frame):,} of {table['total']:,} rows.")
+        container.download_button(
+            "Download all rows (CSV)",
+            data=table["csv"],
+            file_name=table["file_name"],
+            mime="text/csv",
+            key=key,
+        )
+
+
+def message_artifacts(msg: Message) -> dict:
+    """
+    Return a message's parsed chart specs, decoded tables and JSON dumps, built on first use.
+
+    History messages are never changed once appended and stay the same objects across
+    reruns, so the artifacts are cached in session state per message object. A rerun then
+    redraws the history without parsing chart JSON or rebuilding DataFrames again.
+
+    Parameters:
+    msg (Message): A message from st.session_state.messages.
+
+    Returns:
+    dict: Content item index to its chart spec (dict), table (build_table()) or JSON (str).
+    """
+    if "render_cache" not in st.session_state:
+        st.session_state.render_cache = {}
+    entry = st.session_state.render_cache.get(id(msg))
+    # The identity check guards against an id reused by a newer object after a message was removed
+    if entry is not None and entry[0] is msg:
+        return entry[1]
+    artifacts = {}
+    for item_index, content_item in enumerate(msg.content):
+        item = content_item.actual_instance
+        match item.type:
+            case "text":
+                pass
+            case "chart":
+                artifacts[item_index] = json.loads(item.chart.chart_spec)
+            case "table":
+                if item.table.result_set is not None:
+                    artifacts[item_index] = build_table(item.table.result_set)
+            case _:
+                artifacts[item_index] = item.to_json()
+    st.session_state.render_cache[id(msg)] = (msg, artifacts)
+    return artifacts
+
+
+def prune_render_cache(messages: list) -> None:
+    """Drop cached artifacts of messages no longer in the conversation."""
+    cache = st.session_state.get("render_cache")
+    if not cache:
+        return
+    live = {id(message) for message in messages}
+    for key in [key for key in cache if key not in live]:
+        del cache[key]
+
+
+def render_message(msg: Message, index: int):
+    artifacts = message_artifacts(msg)
     with st.chat_message(msg.role):
-        for content_item in msg.content:
+        for item_index, content_item in enumerate(msg.content):
             match content_item.actual_instance.type:
                 case "text":
                     st.markdown(content_item.actual_instance.text)
                 case "chart":
-                    spec = json.loads(content_item.actual_instance.chart.chart_spec)
-                    st.vega_lite_chart(spec, use_container_width=True)
+                    st.vega_lite_chart(artifacts[item_index], use_container_width=True)
                 case "table":
-                    data_array = np.array(
-                        content_item.actual_instance.table.result_set.data
-                    )
-                    column_names = [
-                        col.name
-                        for col in content_item.actual_instance.table.result_set.result_set_meta_data.row_type
-                    ]
-                    st.dataframe(pd.DataFrame(data_array, columns=column_names))
+                    if item_index in artifacts:
+                        render_table(st.container(), artifacts[item_index], f"table-{index}-{item_index}")
                 case _:
-                    st.expander(content_item.actual_instance.type).json(
-                        content_item.actual_instance.to_json()
-                    )
+                    st.expander(content_item.actual_instance.type).json(artifacts[item_index])
 
 
 st.title("YuuBot Lite")
@@ -437,15 +540,21 @@ st.title("YuuBot Lite")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-for message in st.session_state.messages:
-    render_message(message)
+for index, message in enumerate(st.session_state.messages):
+    render_message(message, index)
+prune_render_cache(st.session_state.messages)
 
-# Sidebar UI: on-demand event trace & analysis using non-streaming Weave op
+# Sidebar UI: event trace & analysis. Uses the events recorded from the last streamed reply;
+# only without one (e.g. a fresh session) does it fetch a dump with the non-streaming Weave op
 with st.sidebar.expander("Event trace & analysis", expanded=False):
     if st.button("Fetch events and analyze"):
         with st.spinner("Fetching events..."):
             try:
-                resp = agent_run_weave(st.session_state.messages)
+                if st.session_state.get("last_events"):
+                    # Already analyzed (and billed) when the answer streamed
+                    resp = {"events": st.session_state.last_events, "body": None, "cached": True}
+                else:
+                    resp = agent_run_weave(st.session_state.messages)
             except Exception as e:
                 st.error(f"Failed to fetch events: {e}")
             else:
@@ -454,15 +563,20 @@ with st.sidebar.expander("Event trace & analysis", expanded=False):
                     st.info("No events found in non-streaming response; showing body instead.")
                     st.json(resp.get("body"))
                 else:
-                    summary = analyze_events(events)
+                    summary = analyze_events(events, cached=resp.get("cached", False))
+                    out = summary.get("output", {})
                     st.write("**Event counts**")
-                    st.json(summary.get("counts"))
+                    st.json(out.get("counts"))
                     st.write("**Sample event data**")
-                    for s in summary.get("samples", []):
+                    for s in out.get("samples", []):
                         st.code(s)
                     st.write("**Extracted assistant texts**")
-                    for t in summary.get("assistant_texts", []):
+                    for t in out.get("assistant_texts", []):
                         st.markdown(t)
+                    st.write("**Tokens**")
+                    st.json(summary.get("usage_details", {}))
+                    st.write("**Latency (s)**")
+                    st.json(out.get("latency", {}))
 
 if user_input := st.chat_input("What is your question?"):
     process_new_message(prompt=user_input)